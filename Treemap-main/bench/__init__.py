@@ -0,0 +1,6 @@
+"""Benchmarks of treemap layout, rendering, and the restructure tools,
+on synthetic data of chosen shape and size (see generators.py).
+
+Example use (from the project directory):
+   python3 -m bench.run --sizes 1000 10000 100000 --output bench.json
+"""
@@ -0,0 +1,119 @@
+"""Synthetic data for benchmarks.
+
+Each nest generator takes the number of leaves n and a random.Random,
+so that the same seed always produces the same nest:
+
+  flat      a list of n numbers
+  deep      nested groups, each split in two, about log2(n) levels deep
+  wide      about sqrt(n) groups of about sqrt(n) leaves each
+  skewed    a list of n numbers with a heavy-tailed (Pareto) distribution
+  labelled  dicts of labelled groups and labelled leaves, 3 levels deep
+  mixed     a random mix of lists, dicts, and numbers
+
+There are also generators of CSV input for the restructure tools
+(csv_to_json.py and schematize.py), with their schemas.
+"""
+
+import io
+import csv
+import math
+import random
+from typing import Callable
+
+# Nest as in mapper.py; repeated here so that generating data
+# does not require importing the display modules
+Nest = int | float | list["Nest"] | dict[str, "Nest"]
+
+
+def flat(n: int, rng: random.Random) -> Nest:
+    return [rng.randint(1, 100) for _ in range(n)]
+
+
+def deep(n: int, rng: random.Random) -> Nest:
+    if n == 1:
+        return rng.randint(1, 100)
+    half = n // 2
+    return {"L": deep(half, rng), "R": deep(n - half, rng)}
+
+
+def wide(n: int, rng: random.Random) -> Nest:
+    width = max(1, math.isqrt(n))
+    groups = {}
+    for g in range(0, n, width):
+        groups[f"group {g // width}"] = flat(min(width, n - g), rng)
+    return groups
+
+
+def skewed(n: int, rng: random.Random) -> Nest:
+    return [int(rng.paretovariate(1.2)) for _ in range(n)]
+
+
+def labelled(n: int, rng: random.Random) -> Nest:
+    fanout = max(1, round(n ** (1 / 3)))
+    structure = {}
+    for i in range(n):
+        top, middle, leaf = i // (fanout * fanout), i // fanout % fanout, i % fanout
+        group = structure.setdefault(f"Top {top}", {}).setdefault(f"Middle {middle}", {})
+        group[f"Leaf {leaf}"] = rng.randint(1, 1000)
+    return structure
+
+
+def mixed(n: int, rng: random.Random) -> Nest:
+    if n == 1:
+        return rng.choice([rng.randint(1, 100), rng.uniform(0.5, 100.0)])
+    parts = rng.randint(2, min(8, n))
+    sizes = [n // parts] * parts
+    sizes[-1] += n - sum(sizes)
+    children = [mixed(size, rng) for size in sizes]
+    if rng.random() < 0.5:
+        return children
+    return {f"part {i}": child for i, child in enumerate(children)}
+
+
+SHAPES: dict[str, Callable[[int, random.Random], Nest]] = {
+    "flat": flat, "deep": deep, "wide": wide,
+    "skewed": skewed, "labelled": labelled, "mixed": mixed,
+}
+
+
+def leaves(nest: Nest) -> int:
+    """Number of numbers in nest"""
+    if isinstance(nest, list):
+        return sum(leaves(item) for item in nest)
+    if isinstance(nest, dict):
+        return sum(leaves(item) for item in nest.values())
+    return 1
+
+
+def columns_csv(n: int, rng: random.Random) -> tuple[str, dict[str, list[str]]]:
+    """CSV text of n rows with three label columns and a value column,
+    for csv_to_json.py, and its schema.  As in hand-made tables, a label
+    is left blank when it repeats the label of the row before.
+    """
+    fanout = max(1, round(n ** (1 / 3)))
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["Program", "Level", "Course", "SCH"])
+    previous = ["", "", ""]
+    for i in range(n):
+        row = [f"P{i // (fanout * fanout)}", f"L{i // fanout % fanout}", f"C{i}"]
+        shown = [label if label != before else "" for label, before in zip(row, previous)]
+        writer.writerow(shown + [rng.randint(1, 1000)])
+        previous = row
+    return out.getvalue(), {"labels": ["Program", "Level", "Course"], "values": ["SCH"]}
+
+
+def keyed_csv(n: int, rng: random.Random) -> tuple[str, dict[str, list[str]]]:
+    """CSV text of n (key, value) rows for schematize.py, and its
+    ancestry map (as produced by schematize.parse_schema).  Keys are
+    placed in about sqrt(n) departments of about sqrt(n) keys each.
+    """
+    width = max(1, math.isqrt(n))
+    out = io.StringIO()
+    writer = csv.writer(out)
+    paths = {}
+    for i in range(n):
+        key = f"K{i}"
+        paths[key] = ["Division", f"Department {i // width}"]
+        writer.writerow([key, rng.randint(1, 1000)])
+    return out.getvalue(), paths
@@ -0,0 +1,167 @@
+"""Time the hot paths of treemap on synthetic data, and write the
+results as JSON, so that runs before and after a change can be compared.
+
+Benchmarks on each nest shape (see generators.py):
+  deep_sum    mapper.deep_sum of the whole nest
+  bisect      mapper.bisect of the list of all leaf values
+  layout      mapper.treemap without drawing
+  coloring    color_contrast.color_for the label path of every leaf
+  svg         mapper.treemap drawing SVG text, with path coloring
+and on generated CSV:
+  csv_to_json restructure/csv_to_json.unflatten
+  schematize  restructure/schematize.reshape
+  aggregate   restructure/aggregate.summarize by the first two labels
+CSV results also give throughput in rows per second; for files of
+millions of rows, e.g.,
+   python3 -m bench.run --shapes flat --sizes 1000000 4000000 --repeat 1
+
+Each result is the best of --repeat runs.  Once a benchmark takes
+longer than --budget seconds for some size, larger sizes of it are
+skipped (and recorded as skipped), so that a quadratic hot path
+shows up as a skip rather than a run that never finishes.
+
+Example use (from the project directory):
+   python3 -m bench.run --sizes 1000 10000 100000 --output bench.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable
+
+import mapper
+import display
+import color_contrast
+import pyramid
+from bench import generators
+from bench.scaling import best_time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "restructure"))
+import csv_to_json
+import schematize
+import aggregate
+
+import tracing
+import logging
+log = tracing.logger(__name__)
+
+WIDTH, HEIGHT = 1600, 1200
+
+
+def label_paths(nest: generators.Nest, prefix: str = "") -> list[str]:
+    """Label path of each leaf, as used for path coloring"""
+    if isinstance(nest, list):
+        return [path for item in nest for path in label_paths(item, prefix)]
+    if isinstance(nest, dict):
+        return [path for key, item in nest.items() for path in label_paths(item, f"{prefix}\x1f{key}")]
+    return [prefix]
+
+
+def leaf_values(nest: generators.Nest) -> list:
+    if isinstance(nest, list):
+        return [value for item in nest for value in leaf_values(item)]
+    if isinstance(nest, dict):
+        return [value for item in nest.values() for value in leaf_values(item)]
+    return [nest]
+
+
+def svg_text(nest: generators.Nest) -> str:
+    renderer = display.svg_only(WIDTH, HEIGHT, coloring="path")
+    mapper.treemap(nest, WIDTH, HEIGHT, renderer)
+    return renderer.media[0].text()
+
+
+def nest_benchmarks(nest: generators.Nest) -> dict[str, Callable[[], object]]:
+    values = leaf_values(nest)
+    paths = label_paths(nest)
+    return {
+        "deep_sum": lambda: mapper.deep_sum(nest),
+        "bisect": lambda: mapper.bisect(values),
+        "layout": lambda: mapper.treemap(nest, WIDTH, HEIGHT, pyramid.NoDisplay()),
+        "coloring": lambda: [color_contrast.color_for(path) for path in paths],
+        "svg": lambda: svg_text(nest),
+    }
+
+
+def csv_benchmarks(n: int, rng: random.Random) -> dict[str, Callable[[], object]]:
+    columns, schema = generators.columns_csv(n, rng)
+    keyed, paths = generators.keyed_csv(n, rng)
+    return {
+        "csv_to_json": lambda: csv_to_json.unflatten(io.StringIO(columns), schema),
+        "schematize": lambda: schematize.reshape(io.StringIO(keyed), paths),
+        "aggregate": lambda: aggregate.summarize(io.StringIO(columns), schema["labels"][:2],
+                                                 schema["values"], io.StringIO()),
+    }
+
+
+def run(sizes: list[int], shapes: list[str], seed: int = 42,
+        repeat: int = 3, budget: float = 10.0) -> dict:
+    """Run all benchmarks on each size of each shape; returns results
+    as a dict suitable for JSON.
+    """
+    results = []
+    over_budget: set[tuple[str, str]] = set()
+
+    def measure(name: str, shape: str, n: int, work: Callable[[], object]):
+        if (name, shape) in over_budget:
+            results.append({"benchmark": name, "shape": shape, "leaves": n, "skipped": True})
+            return
+        seconds = best_time(work, repeat)
+        log.info(f"{name:12} {shape:9} {n:>9} leaves: {seconds:.4f}s")
+        result = {"benchmark": name, "shape": shape, "leaves": n, "seconds": seconds}
+        if shape == "csv":
+            result["rows_per_second"] = n / seconds if seconds else None
+        results.append(result)
+        if seconds > budget:
+            over_budget.add((name, shape))
+
+    for n in sorted(sizes):
+        for shape in shapes:
+            nest = generators.SHAPES[shape](n, random.Random(seed))
+            for name, work in nest_benchmarks(nest).items():
+                measure(name, shape, n, work)
+        for name, work in csv_benchmarks(n, random.Random(seed)).items():
+            measure(name, "csv", n, work)
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "seed": seed, "repeat": repeat, "budget": budget,
+            "results": results}
+
+
+def cli() -> object:
+    """Obtain options from the command line."""
+    parser = argparse.ArgumentParser("Benchmark treemap layout, rendering, and restructuring")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000],
+                        help="Numbers of leaves (up to 10_000_000 if you have the memory and time)")
+    parser.add_argument("--shapes", nargs="+", choices=list(generators.SHAPES),
+                        default=list(generators.SHAPES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Report the best of this many runs")
+    parser.add_argument("--budget", type=float, default=10.0,
+                        help="Skip larger sizes of a benchmark after a run takes this many seconds")
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout,
+                        help="JSON results (default standard output)")
+    return parser.parse_args()
+
+
+def main():
+    tracing.configure()
+    args = cli()
+    # Debugging messages would otherwise be printed (and timed)
+    for name in logging.root.manager.loggerDict:
+        if name != __name__:
+            logging.getLogger(name).setLevel(logging.WARNING)
+    results = run(args.sizes, args.shapes, args.seed, args.repeat, args.budget)
+    print(json.dumps(results, indent=3), file=args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measuring how running time grows with the size of the input.
+
+If time is roughly c * n**k, then log(time) is roughly
+log(c) + k * log(n), so k is the slope of the least squares line
+through (log n, log time).  A linear algorithm has exponent near 1,
+n log n a little more, and quadratic near 2, regardless of how fast
+the machine is, which makes the exponent a better test than a time limit.
+"""
+
+import gc
+import math
+import time
+from typing import Callable
+
+MIN_SECONDS = 0.05     # Shortest timing worth measuring, with a coarse clock
+
+
+def best_time(work: Callable[[], object], repeat: int = 5) -> float:
+    """Shortest of repeat timings of work, in seconds of CPU time of this
+    process per run, so that other processes on a busy machine are not
+    counted.  As in timeit, garbage collection is off while timing, and
+    each timing runs work as many times as it takes to last MIN_SECONDS,
+    since the clock may be coarse (on Windows, process_time advances
+    about every 15.6 ms).
+    """
+    number = 1
+    while True:
+        seconds = timed(work, number)
+        if seconds >= MIN_SECONDS:
+            break
+        number *= 2
+    times = [seconds] + [timed(work, number) for _ in range(repeat - 1)]
+    return min(times) / number
+
+
+def timed(work: Callable[[], object], number: int) -> float:
+    """CPU seconds to run work number times"""
+    gc.collect()
+    gc.disable()
+    try:
+        begin = time.process_time()
+        for _ in range(number):
+            work()
+        return time.process_time() - begin
+    finally:
+        gc.enable()
+
+
+def fitted_exponent(sizes: list[int], times: list[float]) -> float:
+    """Slope of the least squares line through (log size, log time).
+
+    >>> round(fitted_exponent([10, 100, 1000], [0.02, 2.0, 200.0]), 6)
+    2.0
+    """
+    if min(times) <= 0:
+        raise ValueError(f"Times must be positive to fit an exponent, not {times}")
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(t) for t in times]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return covariance / variance
+
+
+def scaling_exponent(make_input: Callable[[int], object],
+                     work: Callable[[object], object],
+                     sizes: list[int], repeat: int = 5) -> float:
+    """Fitted exponent of the time of work(make_input(n)) for n in sizes.
+    Inputs are made before timing, so only work is measured.
+    """
+    times = []
+    for n in sizes:
+        data = make_input(n)
+        times.append(best_time(lambda: work(data), repeat))
+    return fitted_exponent(sizes, times)
@@ -11,11 +11,12 @@ more severe visual impairments.  This module deals only with ensuring that
 textual labels on the treemap contrast sufficiently with colors of tiles.
 
 We will produce labels only in black (to contrast with light colors) and
-white (to contrast with dark colors).  Tile background colors are generated
-randomly, then a contrasting label color (black or white) is chosen.
-For some tiles colors  the desired contrast ratio of 7:1, the WCAG AAA criterion,
-cannot be met with either a black or white label.  In that case we generate
-another random color and try again.
+white (to contrast with dark colors).  For some tiles colors  the desired
+contrast ratio of 7:1, the WCAG AAA criterion, cannot be met with either a
+black or white label.  Rather than generating random colors and rejecting
+those that fail, we check a grid of colors once, when the module is loaded,
+and keep those that pass (with their label color) in PALETTE.  Tile
+background colors are then drawn randomly from PALETTE.
 
 Code for determining contrast is absolutely brimming with magic numbers and seemingly arbitrary
 formulas, which are normally a "bad smell" in code.  Rather than defining
@@ -23,18 +24,13 @@ symbolic constants, which would not be helpful in this case, we have tried to
 follow as closely as possible the names and expression of the WCAG documentation
 at https://www.w3.org/WAI/GL/wiki/Relative_luminance .
 """
+import array
 import random
-import logging
-logging.basicConfig()
-log = logging.getLogger(__name__)
-log.setLevel(logging.INFO)
+import zlib
 
-def brightness(r: int, g: int, b: int) -> float:
-    """Relative luminance, for determining whether white or
-    black will have sufficient contrast.
-    Formulas are from https://www.w3.org/WAI/GL/wiki/Relative_luminance
-    """
-    return 0.2126 * s_rgb_val(r) + 0.7152 * s_rgb_val(g) + 0.11 * s_rgb_val(b)
+import metrics
+import tracing
+log = tracing.logger(__name__)
 
 def s_rgb_val(rgb_val: int) -> float:
     """Conversion of pixel value 0..255 to float values used in WCAG guidelines"""
@@ -43,6 +39,16 @@ def s_rgb_val(rgb_val: int) -> float:
         return s_rgb / 12.92
     return ((s_rgb+0.055)/1.055) ** 2.4
 
+# s_rgb_val of each pixel value 0..255
+S_RGB = [s_rgb_val(v) for v in range(256)]
+
+def brightness(r: int, g: int, b: int) -> float:
+    """Relative luminance, for determining whether white or
+    black will have sufficient contrast.
+    Formulas are from https://www.w3.org/WAI/GL/wiki/Relative_luminance
+    """
+    return 0.2126 * S_RGB[r] + 0.7152 * S_RGB[g] + 0.11 * S_RGB[b]
+
 BLACK_BRIGHT = brightness(0, 0, 0)
 WHITE_BRIGHT = brightness(255, 255, 255)
 
@@ -52,26 +58,68 @@ def contrast(foreground: float, background: float) -> float:
     """
     return abs((foreground + 0.05)/(background + 0.05))
 
+# WCAG requires contrast ratio 4.5:1 for text; 7.0 is considered
+# "enhanced" (AAA) contrast, so we'll shoot for that.
+MIN_CONTRAST = 7.0
+
+# Number of values of each of r, g, b that we consider,
+# evenly spaced from 0 to 255
+PALETTE_LEVELS = 32
+
+LABEL_COLORS = ("black", "white")
+
+def build_palette(levels: int = PALETTE_LEVELS) -> array.array:
+    """All colors on a levels x levels x levels grid for which
+    black or white labels have sufficient contrast.  Each is packed
+    as an int 0xLRRGGBB, where L indexes LABEL_COLORS.
+
+    >>> palette = build_palette(2)  # Only 0 and 255 for each of r, g, b
+    >>> [f"{color:07x}" for color in palette]
+    ['1000000', '000ff00', '000ffff', '0ff00ff', '0ffff00', '0ffffff']
+    """
+    palette = array.array("I")
+    values = [round(i * 255 / (levels - 1)) for i in range(levels)]
+    for r in values:
+        for g in values:
+            for b in values:
+                luma = brightness(r, g, b)
+                if (luma + 0.05) / (BLACK_BRIGHT + 0.05) >= MIN_CONTRAST:
+                    label = 0
+                elif (WHITE_BRIGHT + 0.05) / (luma + 0.05) >= MIN_CONTRAST:
+                    label = 1
+                else:
+                    continue
+                palette.append((label << 24) | (r << 16) | (g << 8) | b)
+    # Built once, at import, before counting may be enabled
+    metrics.note("palette.rejected", levels ** 3 - len(palette))
+    return palette
+
+PALETTE = build_palette()
+
+def unpack(color: int) -> tuple[str, str]:
+    """RGB color code and label color of a PALETTE entry"""
+    return f"#{color & 0xffffff:06x}", LABEL_COLORS[color >> 24]
+
 def next_color() -> tuple[str, str]:
-    """Generates random RGB color code and contrast color,
+    """Random RGB color code and contrast color,
     satisfying Web Content Accessibility Guidelines (WCAG).
-    WCAG requires contrast ratio 4.5:1 for text; 7.0 is considered
-    "enhanced" (AAA) contrast, so we'll shoot for that.
+    Colors failing the guidelines were rejected once, building PALETTE,
+    so each color drawn is accepted.
     """
-    while True:
-        r = random.randint(0,255)
-        g = random.randint(0, 255)
-        b = random.randint(0, 255)
-        rgb_code = f"#{r:02x}{g:02x}{b:02x}"
-        luma = brightness(r, g, b)
-        log.debug(f"Color rgb({r},{g},{b}) has brightness {luma}")
-        black_contrast = (luma + 0.05)/(BLACK_BRIGHT + 0.05)
-        if black_contrast >= 7.0:
-            log.debug(f"Sufficient contrast ({black_contrast}) with black")
-            return rgb_code, "black"
-        white_contrast = (WHITE_BRIGHT + 0.05) / (luma + 0.05)
-        if white_contrast >= 7.0:
-            log.debug(f"Sufficent contrast ({white_contrast}) with white")
-            return rgb_code, "white"
-        log.debug(f"Rejecting {r},{g},{b} ({luma}) for {black_contrast} with black and {white_contrast} with white")
+    if metrics.ENABLED:
+        metrics.COUNTS["color.chosen"] += 1
+    return unpack(PALETTE[int(random.random() * len(PALETTE))])
 
+def color_for(key: str) -> tuple[str, str]:
+    """RGB color code and contrast color chosen by a hash of key,
+    so that the same key gets the same color in every run.
+    (Python's own hash of strings differs from run to run.)
+
+    >>> color_for("Sciences") == color_for("Sciences")
+    True
+    >>> color_for("Sciences") in [unpack(color) for color in PALETTE]
+    True
+    """
+    if metrics.ENABLED:
+        metrics.COUNTS["color.chosen"] += 1
+    return unpack(PALETTE[zlib.crc32(key.encode("utf-8")) % len(PALETTE)])
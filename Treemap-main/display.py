@@ -1,25 +1,28 @@
 """Graphical display for treemapper.  Can produce
 SVG file in addition to Tk display.
 
-Note we are using modules (display, tk_display, svg_display) as stateful objects,
-which makes them "singletons".   To allow multiple instances of display would require
-rewrite of all three modules to isolate state in objects managed by other code.
+All state of a rendering (the color stack and the drawing media) is
+kept in a Display object, so several treemaps can be rendered at once,
+e.g., by a server rendering SVG in a pool of threads.  Each medium
+(TkDisplay, SVGDisplay) is likewise an object.  Tk is not thread-safe,
+so only SVG renderings should be shared out among threads.
+
+The module-level functions init, draw_tile, begin_group, end_group and
+wait_close are kept for mapper-skel.py and the HOWTO; they draw on a
+default Display created by init.
 """
 
-import graphics.tk_display as tk
+from typing import Callable
+
 import graphics.svg_display as svg
 import geometry
 import color_contrast
+import labels
+import spatial
+import svg_config
 
-import logging
-logging.basicConfig()
-log = logging.getLogger(__name__)
-log.setLevel(logging.INFO)
-
-
-def init(width: int, height: int):
-    tk.init(width, height)
-    svg.init(width, height)
+import tracing
+log = tracing.logger(__name__)
 
 # For documentation, I want consistent color choice
 # when describing an example step-by-step.
@@ -28,100 +31,186 @@ def init(width: int, height: int):
 # random.seed(43)
 
 
-"""Tactics for drawing on Tk and SVG (and potentially others in future): 
+"""Tactics for drawing on Tk and SVG (and potentially others in future):
 
 Attributes that can be computed once and then interpreted for each medium
 are kept in a property table, rather than passing a whole zoo of parameters
 to each medium-specific drawing function.
 
-For now, colors are randomly generated for each group or top-level individual tile.
+Colors are chosen for each group or top-level individual tile, either
+randomly or (coloring="path") by a hash of the labels of the enclosing
+groups and tile, so that the same data is always drawn the same way.
 """
 
-# ------
-# Each color entry is fill color, label color
-COLOR_STACK: list[tuple[str, str]] = []  # Initially empty
+COLORINGS = ["random", "path"]
 
-def push_new_color():
-    COLOR_STACK.append(color_contrast.next_color())
 
-def pop_color():
-    COLOR_STACK.pop()
+class Display:
+    """Draws tiles and groups on each of a list of media.
+    A medium is an object with methods draw_rect, begin_group,
+    end_group, and close, like SVGDisplay and TkDisplay.
+    """
+    def __init__(self, media: list, coloring: str = "random"):
+        assert coloring in COLORINGS, f"Coloring must be one of {COLORINGS}"
+        self.media = media
+        self.coloring = coloring
+        # Each color entry is fill color, label color
+        self.color_stack: list[tuple[str, str]] = []  # Initially empty
+        # Labels of enclosing groups
+        self.label_path: list[str] = []
+
+    def new_color(self, label: str) -> tuple[str, str]:
+        """Fill color and label color for a group or tile with label"""
+        if self.coloring == "path":
+            # Only the first line of a tile label, e.g., "Apples" of "Apples\n12",
+            # so that the color does not change with the value
+            key = label.split("\n", 1)[0]
+            return color_contrast.color_for("\x1f".join(self.label_path + [key]))
+        return color_contrast.next_color()
+
+    def push_new_color(self, label: str = ""):
+        self.color_stack.append(self.new_color(label))
+        self.label_path.append(label)
+
+    def pop_color(self):
+        self.color_stack.pop()
+        self.label_path.pop()
+
+    def set_tile_color(self, properties: dict):
+        """Adds tile color properties"""
+        if len(self.color_stack) > 0:
+            fill_color, label_color = self.color_stack[-1]
+        else:
+            fill_color, label_color = self.new_color(properties.get("label", ""))
+        properties["fill_color"] = fill_color
+        properties["stroke_color"] = "white"
+        properties["label_color"] = label_color
+
+    def draw_tile(self, r: geometry.Rect, label: str | None = None):
+        """Draw the tile (on all media).
+         Displays on Tk (Python built-in graphics) and
+         also writes corresponding graphics into buffer to
+         produce corresponding SVG diagram which can be displayed
+         in a web page, imported into a diagramming tool like
+         Inkscape, OmniGraffle, Illustrator, etc.
+        """
+        log.debug("Drawing %s", r)
+        properties = {"margin": 4, "class": "tile"}
+        if label:
+            properties["label"] = label
+            properties["label_fit"] = fit_label(label, r, properties["margin"])
+        self.set_tile_color(properties)
+        for medium in self.media:
+            medium.draw_rect(r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
+
+    def begin_group(self, r: geometry.Rect, label: str | None = None):
+        """A group contains multiple rectangular regions.
+        Rendering may differ between SVG and Tk versions,
+        but in both cases we want to show hierarchy.
+        The optional label appears as a tool-tip in the SVG version.
+        """
+        if not label:
+            label = ""
+        self.push_new_color(label)
+        properties = {"margin": 2, "class": "group_outline"}
+        self.set_tile_color(properties)
+        for medium in self.media:
+            medium.begin_group(label, r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
+
+    def end_group(self):
+        """Must be matched with begin_group"""
+        self.pop_color()
+        for medium in self.media:
+            medium.end_group()
+
+    def outline_group(self, r: geometry.Rect):
+        log.debug("Outlining %s", r)
+        properties = {"margin": 2, "class": "group_outline"}
+        properties["fill_color"] = None
+        properties["stroke_color"] = "red"
+        for medium in self.media:
+            medium.draw_rect(r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
+
+    def close(self, index: spatial.Node = None,
+              expand: Callable[[list[spatial.Group], "Display"], None] | None = None):
+        """Finish each medium.  Non-interactive media (SVG) are
+        finished first, because an interactive medium (Tk) holds
+        the display on screen until the user indicates finish.
+        An interactive medium may use the spatial index of the
+        layout (see spatial.py), e.g., for tool-tips.  If the layout
+        has collapsed groups, expand(path, renderer) lays out the group
+        at the end of path on request of a medium, drawing with a
+        renderer for just that medium.
+        """
+        for medium in self.media:
+            if expand is None:
+                medium.close(index)
+            else:
+                renderer = Display([medium], self.coloring)
+                medium.close(index, lambda path: expand(path, renderer))
+
+
+def fit_label(label: str, r: geometry.Rect, margin: int) -> labels.Fit | None:
+    """How label will be shown inside the margins of r, the same on all media"""
+    if not svg_config.SVG_HIDE_LONG_LABELS:
+        return labels.Fit(tuple(label.split("\n")), False)
+    return labels.fit_label(label, r.width() - 2 * margin, r.height() - 2 * margin)
+
+
+def view_of(viewport: geometry.Rect | None) -> tuple[int, int, int, int] | None:
+    """Viewport rectangle as (llx, lly, urx, ury), as media expect it"""
+    if viewport is None:
+        return None
+    return viewport.ll.x, viewport.ll.y, viewport.ur.x, viewport.ur.y
+
+
+def tk_and_svg(width: int, height: int, svg_path: str = "treemap.svg",
+               coloring: str = "random",
+               viewport: geometry.Rect | None = None) -> Display:
+    """The usual display: a Tk window and an SVG file.
+    With a viewport, both show only that part of the layout.
+    """
+    # Importing Zelle graphics creates a Tk root window, which fails
+    # without a screen, so we import it only when it is needed.
+    import graphics.tk_display as tk
+    view = view_of(viewport)
+    return Display([svg.SVGDisplay(width, height, svg_path, view),
+                    tk.TkDisplay(width, height, view)],
+                   coloring)
+
+
+def svg_only(width: int, height: int, svg_path: str | None = None,
+             coloring: str = "random",
+             viewport: geometry.Rect | None = None,
+             stream: bool = False) -> Display:
+    """SVG without Tk, e.g., for a server.  With no svg_path,
+    the SVG text is obtained from the SVGDisplay in media[0].
+    With stream, the SVG is written to svg_path as it is drawn.
+    """
+    return Display([svg.SVGDisplay(width, height, svg_path, view_of(viewport), stream)], coloring)
 
-def set_tile_color(properties: dict):
-    """Adds tile color properties"""
-    if len(COLOR_STACK) > 0:
-        fill_color, label_color = COLOR_STACK[-1]
-    else:
-        fill_color, label_color = color_contrast.next_color()
-    properties["fill_color"] = fill_color
-    properties["stroke_color"] = "white"
-    properties["label_color"] = label_color
 
 # ------
+# The default display used by the module-level functions below
+
+DEFAULT: Display | None = None
+
+def init(width: int, height: int):
+    global DEFAULT
+    DEFAULT = tk_and_svg(width, height)
 
 def draw_tile(r: geometry.Rect, label: str | None = None):
-    """Draw the tile (on both media).
-     Displays on Tk (Python built-in graphics) and
-     also writes corresponding graphics into buffer to
-     produce corresponding SVG diagram which can be displayed
-     in a web page, imported into a diagramming tool like
-     Inkscape, OmniGraffle, Illustrator, etc.
-    """
-    log.debug(f"Drawing {r}")
-    properties = {"margin": 4, "class": "tile"}
-    if label:
-        properties["label"] = label
-    fill_color, label_color = color_contrast.next_color()
-    set_tile_color(properties)
-    tk.draw_rect(r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
-    svg.draw_rect(r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
-    llx, lly, urx, ury = r.ll.x, r.ll.y, r.ur.x, r.ur.y
-    if label:
-        tk.draw_label(label, llx, lly, urx, ury, properties)
-        svg.draw_label(label, llx, lly, urx, ury, properties)
+    DEFAULT.draw_tile(r, label)
 
 def begin_group(r: geometry.Rect, label: str | None = None):
-    """A group contains multiple rectangular regions.
-    Rendering may differ between SVG and Tk versions,
-    but in both cases we want to show hierarchy.
-    The optional label appears as a tool-tip in the SVG version.
-    """
-    if not label:
-        label = ""
-    push_new_color()
-    # Allocate color whether or not we use it, to
-    # maintain consistency between Tk display and SVG
-    fill_color, stroke_color = color_contrast.next_color()
-    # Tk version - outline the group in red
-    # Label is not visible
-    properties = {"margin": 2, "class": "group_outline"}
-    properties["fill_color"] = None
-    properties["stroke_color"] = "red"
-    tk.draw_rect(r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
-    # SVG version - create SVG group
-    set_tile_color(properties)
-    svg.begin_group(label, r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
+    DEFAULT.begin_group(r, label)
 
 def end_group():
-    """Must be matched with begin_group"""
-    # Tk:  Nothing to do
-    # SVG: Ends the SVG group
-    pop_color()
-    svg.end_group()
-
-
+    DEFAULT.end_group()
 
 def outline_group(r: geometry.Rect):
-    log.debug(f"Outlining {r}")
-    properties = {"margin": 2, "class": "group_outline"}
-    properties["fill_color"] = None
-    properties["stroke_color"] = "red"
-    tk.draw_rect(r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
-    svg.draw_rect(r.ll.x, r.ll.y, r.ur.x, r.ur.y, properties)
-
-
+    DEFAULT.outline_group(r)
 
 def wait_close():
     """Hold display on screen until user indicates finish"""
-    svg.close()
-    tk.wait_close()
+    DEFAULT.close()
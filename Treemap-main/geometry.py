@@ -1,8 +1,8 @@
 """Integer geometry (points and rectangles) for tree mapping."""
-import logging
-logging.basicConfig()
-log = logging.getLogger(__name__)
-log.setLevel(logging.INFO)
+import metrics
+
+import tracing
+log = tracing.logger(__name__)
 class Point:
     def __init__(self, x: int, y: int):
         self.x = x
@@ -38,22 +38,31 @@ class Rect:
     def width(self) -> int:
         return self.ur.x - self.ll.x
 
+    def intersects(self, other: "Rect") -> bool:
+        """Do this rectangle and other overlap?  Rectangles that
+        only touch along an edge do not overlap.
+        """
+        return (self.ll.x < other.ur.x and other.ll.x < self.ur.x and
+                self.ll.y < other.ur.y and other.ll.y < self.ur.y)
+
     def split(self, fraction: float) -> tuple["Rect", "Rect"]:
         """Returns two sub-rectangles that together constitute
         this rectangle, with ratio of first to second approximately 'fraction'
         (subject to rounding error).
         """
+        if metrics.ENABLED:
+            metrics.COUNTS["rect.split"] += 1
         if self.height() > self.width():
             frac_height = int(self.height() * fraction)
             bottom = Rect(self.ll, Point(self.ur.x, self.ll.y + frac_height))
             top = Rect(Point(self.ll.x, self.ll.y + frac_height), self.ur)
-            log.debug(f"Splitting {self} vertically into {bottom}, {top}")
+            log.debug("Splitting %s vertically into %s, %s", self, bottom, top)
             return bottom, top
         else:
             frac_width = int(self.width() * fraction)
             left = Rect(self.ll, Point(self.ll.x + frac_width, self.ur.y))
             right = Rect(Point(self.ll.x + frac_width, self.ll.y), self.ur)
-            log.debug(f"Splitting {self} horizontally into {left}, {right}")
+            log.debug("Splitting %s horizontally into %s, %s", self, left, right)
             return left, right
 
 
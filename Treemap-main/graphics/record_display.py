@@ -0,0 +1,39 @@
+"""Recording "display" of Treemap: instead of drawing, keeps a list
+of the tiles and groups, e.g., to send to a web page that draws them.
+"""
+
+
+class RecordDisplay:
+    """Each tile or group is recorded as a dict with its kind ("tile"
+    or "group"), position, size, label, colors, and depth of nesting
+    in groups.  Coordinates are those of the layout, with y increasing
+    upward from 0 (SVG draws them with y increasing downward).
+    """
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.records: list[dict] = []
+        self.depth = 0
+
+    def record(self, kind: str, label: str | None,
+               llx: int, lly: int, urx: int, ury: int, properties: dict):
+        self.records.append({"kind": kind, "x": llx, "y": lly,
+                             "width": urx - llx, "height": ury - lly,
+                             "label": label, "depth": self.depth,
+                             "fill_color": properties.get("fill_color"),
+                             "label_color": properties.get("label_color")})
+
+    def draw_rect(self, llx, lly, urx, ury, properties: dict):
+        self.record("tile", properties.get("label"), llx, lly, urx, ury, properties)
+
+    def begin_group(self, label: str | None,
+                    llx: int, lly: int, urx: int, ury: int,
+                    properties: dict):
+        self.record("group", label, llx, lly, urx, ury, properties)
+        self.depth += 1
+
+    def end_group(self):
+        self.depth -= 1
+
+    def close(self, index=None, expand=None):
+        pass
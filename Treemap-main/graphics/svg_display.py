@@ -1,29 +1,27 @@
-"""SVG display of Treemap"""
-import io
+"""SVG display of Treemap.
+All state of a rendering is kept in an SVGDisplay object, so
+several SVG renderings may be in progress at once (e.g., in
+different threads of a server).
+"""
 import sys
 
-import svg_config
+import labels
+import metrics
 
-import logging
-logging.basicConfig()
-log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+import tracing
+log = tracing.logger(__name__)
 
-# These are all set in the 'init' function
-SVG_BUFFER: list[str] = []
-SVG_OUT: io.BytesIO | None = None
-WIDTH = 0
-HEIGHT = 0
 ELIDE_WIDE_LABELS = False  # This really belongs in a configuration file
+STREAM_CHUNK = 4096  # Buffer entries written at a time when streaming
 
 SVG_HEAD = ""
 SVG_PROLOG = """"
    <defs>
    <style>
-    text {  text-anchor: middle;  
+    text {  text-anchor: middle;
             font-family: Helvetica, Arial, sans-serif;
             font-size: 12pt;
-            white-space: pre-wrap; 
+            white-space: pre-wrap;
     }
     tspan { white-space: pre-wrap; }
     .tile_label_white { fill: white;  white-space: pre-wrap; }
@@ -34,28 +32,6 @@ SVG_PROLOG = """"
    </defs>
 """
 
-def init(width: int, height: int, svg_path: str = None):
-    """We keep SVG commands in a buffer, to be written
-    at the end of execution.
-    """
-    global SVG_BUFFER
-    global SVG_OUT
-    global WIDTH
-    global HEIGHT
-    WIDTH, HEIGHT = width, height
-    if svg_path == None:
-        svg_path = "treemap.svg"
-    try:
-        SVG_OUT = open(svg_path, "w")
-        svg_header = f"""
-        <svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" >
-        """
-        SVG_BUFFER = [svg_header, SVG_PROLOG]
-        log.info(f"SVG figure will be written to {svg_path}")
-    except FileNotFoundError:
-        log.warning(f"Could not open {svg_path}")
-        sys.exit(1)
-
 
 def xml_escape(s: str) -> str:
     """"Escape XML special characters as XML entities"""
@@ -65,91 +41,138 @@ def xml_escape(s: str) -> str:
             replace('"', '&quot;'))
 
 
-
-def draw_rect(llx, lly, urx, ury, properties: dict):
-    """Generate display directions for a tile in SVG rendering.
-    Includes labeling the rectangle, in text or as a tool-tip.
+class SVGDisplay:
+    """We keep SVG commands in a buffer, to be written
+    at the end of execution.  If svg_path is None, nothing
+    is written; the SVG text is available from the text() method.
+    If view (llx, lly, urx, ury) is given, just that region of the
+    layout is shown, scaled to width x height.
+    With stream=True, the buffer is written out whenever it reaches
+    STREAM_CHUNK entries, so that a very large treemap does not have to
+    be held in memory as text; the text() method then returns only
+    what has not yet been written.
     """
-    margin = properties["margin"]
-    css_class = properties["class"]
-    SVG_BUFFER.append(
-        f"""<g><rect x="{llx + margin}" y="{lly + margin}" 
-         width="{urx - llx - 2 * margin}"  height="{ury - lly - 2 * margin}"
-         rx="10"  fill="{properties["fill_color"]}" 
-         class="{css_class}" />
-      """)
-    if "label" in properties:
-        # Label is associated with group that wraps rect, so that
-        # it can be rendered as either <title> or <text> depending
-        # on available space
-        draw_label(properties["label"], llx, lly, urx, ury, properties)
-    SVG_BUFFER.append("</g>")
-
-
-def begin_group(label: str | None,
+    def __init__(self, width: int, height: int, svg_path: str | None = "treemap.svg",
+                 view: tuple[int, int, int, int] | None = None,
+                 stream: bool = False):
+        assert svg_path or not stream, "Streaming SVG requires a file to write"
+        self.width = width
+        self.height = height
+        self.stream = stream
+        self.out = None
+        if svg_path:
+            try:
+                self.out = open(svg_path, "w")
+                log.debug("SVG figure will be written to %s", svg_path)
+            except FileNotFoundError:
+                log.warning("Could not open %s", svg_path)
+                sys.exit(1)
+        view_box = ""
+        if view:
+            llx, lly, urx, ury = view
+            view_box = f'viewBox="{llx} {lly} {urx - llx} {ury - lly}"'
+        svg_header = f"""
+        <svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" {view_box}>
+        """
+        self.buffer: list[str] = [svg_header, SVG_PROLOG]
+        self.counted = 0    # Entries of buffer counted in svg.bytes
+
+    def draw_rect(self, llx, lly, urx, ury, properties: dict):
+        """Generate display directions for a tile in SVG rendering.
+        Includes labeling the rectangle, in text or as a tool-tip.
+        """
+        margin = properties["margin"]
+        css_class = properties["class"]
+        if metrics.ENABLED:
+            metrics.COUNTS["svg.elements"] += 2   # <g>, <rect>
+        self.buffer.append(
+            f"""<g><rect x="{llx + margin}" y="{lly + margin}"
+             width="{urx - llx - 2 * margin}"  height="{ury - lly - 2 * margin}"
+             rx="10"  fill="{properties["fill_color"]}"
+             class="{css_class}" />
+          """)
+        if "label" in properties:
+            # Label is associated with group that wraps rect, so that
+            # it can be rendered as either <title> or <text> depending
+            # on available space
+            self.draw_label(properties["label"], llx, lly, urx, ury, properties)
+        self.buffer.append("</g>")
+        if self.stream and len(self.buffer) >= STREAM_CHUNK:
+            self.flush()
+
+    def begin_group(self, label: str | None,
                     llx: int, lly: int, urx: int, ury: int,
                     properties: dict):
-    margin = properties["margin"]
-    if label:
-        group_label = f"\n<title>{xml_escape(label)}</title>"
-    else:
-        group_label = ""
-    SVG_BUFFER.append(
-        f"""<g class="group">{group_label}
-        <rect x="{llx + margin}" y="{lly + margin}" 
-        width="{urx - llx - 2 * margin}"  height="{ury - lly - 2 * margin}"
-        rx="5"  
-        class="group_outline" />
+        margin = properties["margin"]
+        if metrics.ENABLED:
+            metrics.COUNTS["svg.elements"] += 3 if label else 2   # <g>, <title>, <rect>
+        if label:
+            group_label = f"\n<title>{xml_escape(label)}</title>"
+        else:
+            group_label = ""
+        self.buffer.append(
+            f"""<g class="group">{group_label}
+            <rect x="{llx + margin}" y="{lly + margin}"
+            width="{urx - llx - 2 * margin}"  height="{ury - lly - 2 * margin}"
+            rx="5"
+            class="group_outline" />
+            """
+        )
+
+    def end_group(self):
+        self.buffer.append("</g>")
+        if self.stream and len(self.buffer) >= STREAM_CHUNK:
+            self.flush()
+
+    def draw_label(self, label: str, llx: int, lly: int, urx: int, ury: int,
+                   properties: dict):
+        """Generate display directions for a label in SVG rendering.
+        Rendered as <text> if it fits (see labels.py), and as a <title>
+        (tool-tip) if it does not fit or had to be truncated, so
+        make sure there is an element (e.g., a <g>...</g>) to attach the
+        title to.
         """
-    )
-
-CHAR_WIDTH_APPROX = 17  # Rough approximation of average character width in pixels
-
-def text_width_roughly(label: str) -> int:
-    """Approximate width of a string in pixels, based on
-    rendering in a 12pt font.  Very rough since real width
-    depends on font, screen resolution, width of individual
-    characters, etc.  Just a "better than nothing" guess.
-    """
-    lines = label.split()  # Guess at LONGEST line
-    longest = 0
-    for line in lines:
-        longest = max(longest, len(line) * CHAR_WIDTH_APPROX)
-    return longest
-
-
-def end_group():
-    SVG_BUFFER.append("</g>")
-
-
-def draw_label(label: str, llx: int, lly: int, urx: int, ury: int,
-               properties: dict):
-    """Generate display directions for a label in SVG rendering.
-    May be rendered as <text> or <title> depending on available space, so
-    make sure there is an element (e.g., a <g>...</g>) to attach the
-    title to.
-    """
-    center_x = (urx + llx) // 2
-    center_y = (lly + ury) // 2
-    width = text_width_roughly(label)
-
-    # If a label contains special HTML/XML characters, they must be escaped,
-    # and newlines should break the text into parts
-    label = xml_escape(label)
-
-    if svg_config.SVG_HIDE_LONG_LABELS and width > (urx - llx):
-        label = label.replace('\n', ' – ')
-        SVG_BUFFER.append(f"""<title>{label}</title>""")
-
-    else:
-        label = label.replace('\n', f'</tspan><br /><tspan x="{center_x}" dy="1em">')
-        SVG_BUFFER.append(
-            f"""<text x="{center_x}"  y="{center_y}"
-             class="tile_label_{properties["label_color"]}" ><tspan>{label}</tspan></text>
+        fit = properties.get("label_fit")
+        if fit is None or fit.truncated:
+            # If a label contains special HTML/XML characters, they must be escaped
+            title = xml_escape(label).replace('\n', ' – ')
+            if metrics.ENABLED:
+                metrics.COUNTS["svg.elements"] += 1
+            self.buffer.append(f"""<title>{title}</title>""")
+        if fit is None:
+            return
+        if metrics.ENABLED:
+            metrics.COUNTS["svg.elements"] += 1 + len(fit.lines)   # <text>, <tspan>s
+
+        center_x = (urx + llx) // 2
+        # Center the block of lines vertically
+        top_y = (lly + ury) // 2 - (len(fit.lines) - 1) * labels.LINE_HEIGHT_PX // 2
+        text = f'</tspan><br /><tspan x="{center_x}" dy="1em">'.join(
+            xml_escape(line) for line in fit.lines)
+        self.buffer.append(
+            f"""<text x="{center_x}"  y="{top_y}"
+             class="tile_label_{properties["label_color"]}" ><tspan>{text}</tspan></text>
           """)
 
-def close():
-    log.info(f"Saving SVG representation as {SVG_OUT.name}")
-    SVG_BUFFER.append("</svg>")
-    SVG_OUT.write("".join(SVG_BUFFER))
-    SVG_OUT.close()
\ No newline at end of file
+    def text(self) -> str:
+        """The SVG commands produced so far, as one string"""
+        if metrics.ENABLED:
+            # Each entry once, however often the text is taken
+            metrics.COUNTS["svg.bytes"] += sum(len(entry.encode("utf-8"))
+                                               for entry in self.buffer[self.counted:])
+        self.counted = len(self.buffer)
+        return "".join(self.buffer)
+
+    def flush(self):
+        """Write out the buffer (and when streaming, empty it)"""
+        self.out.write(self.text())
+        if self.stream:
+            self.buffer.clear()
+            self.counted = 0
+
+    def close(self, index=None, expand=None):
+        self.buffer.append("</svg>")
+        if self.out:
+            log.debug("Saving SVG representation as %s", self.out.name)
+            self.flush()
+            self.out.close()
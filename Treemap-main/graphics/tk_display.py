@@ -1,55 +1,109 @@
 """
 Tk (built-in Python graphics package) display of Treemap canvas.
+Importing this module opens the (hidden) Tk root window, so it
+should be imported only when a Tk display is actually wanted.
 """
 
+from typing import Callable
+
 from . import graphics  # Zelle's Tk graphics package
+import spatial
 
 
-import logging
-logging.basicConfig()
-log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+import tracing
+log = tracing.logger(__name__)
 
-CANVAS: graphics.GraphWin | None = None
 
-def init(width: int, height: int):
-    global CANVAS
-    CANVAS = graphics.GraphWin("Treemap", width, height)
-    CANVAS.setCoords(0, 0, width, height)
+class TkDisplay:
+    """A Tk window for drawing one treemap.
+    If view (llx, lly, urx, ury) is given, just that region of the
+    layout is shown, scaled to the window.
+    """
+    def __init__(self, width: int, height: int,
+                 view: tuple[int, int, int, int] | None = None):
+        self.canvas = graphics.GraphWin("Treemap", width, height)
+        self.tooltip = None  # Canvas item showing labels under the mouse
+        if view:
+            # Layout y coordinates are flipped when drawn (see draw_rect)
+            llx, lly, urx, ury = view
+            self.canvas.setCoords(llx, height - ury, urx, height - lly)
+        else:
+            self.canvas.setCoords(0, 0, width, height)
 
+    def draw_rect(self, llx, lly, urx, ury, properties: dict):
+        """Draw and label the rectangle on the Tk (Python built-in) display.
+        Flips y axis (0 is at top).
+        """
+        margin = properties["margin"]
+        lly_flipped = self.canvas.height - lly
+        ury_flipped = self.canvas.height - ury
+        image = graphics.Rectangle(graphics.Point(llx+margin, lly_flipped-margin),
+                                  graphics.Point(urx-margin,ury_flipped+margin))
+        fill = properties["fill_color"]
+        if fill:
+            image.setFill(fill)
+        stroke = properties["stroke_color"]
+        if stroke:
+            image.setOutline(stroke)
+        image.draw(self.canvas)
+        if "label" in properties:
+            self.draw_label(properties["label"], llx, lly, urx, ury, properties)
 
-def draw_rect(llx, lly, urx, ury, properties: dict):
-    """Draw and label the rectangle on the Tk (Python built-in) display.
-    Flips y axis (0 is at top).
-    """
-    assert CANVAS, "Did you forget to initialize the window?"
-    margin = properties["margin"]
-    lly_flipped = CANVAS.height - lly
-    ury_flipped = CANVAS.height - ury
-    image = graphics.Rectangle(graphics.Point(llx+margin, lly_flipped-margin),
-                              graphics.Point(urx-margin,ury_flipped+margin))
-    fill = properties["fill_color"]
-    if fill:
-        image.setFill(fill)
-    stroke = properties["stroke_color"]
-    if stroke:
-        image.setOutline(stroke)
-    image.draw(CANVAS)
-
-def draw_label(label: str, llx: int, lly: int, urx: int, ury: int, properties: dict):
-    lly_flipped = CANVAS.height - lly
-    ury_flipped = CANVAS.height - ury
-    label = graphics.Text(graphics.Point((llx + urx)/2, (lly_flipped + ury_flipped)/2), label)
-    label.setSize(12)
-    label.setFace("helvetica")
-    label.setTextColor(properties["label_color"])
-    label.draw(CANVAS)
-
-
-def wait_close():
-    """Hold display on screen until user clicks"""
-    print("Click window to close it")
-    CANVAS.getMouse()
-    CANVAS.close()
+    def draw_label(self, label: str, llx: int, lly: int, urx: int, ury: int, properties: dict):
+        """Label as fit to the tile (see labels.py); omitted if it does not fit"""
+        if "label_fit" in properties:
+            fit = properties["label_fit"]
+            if fit is None:
+                return
+            label = "\n".join(fit.lines)
+        lly_flipped = self.canvas.height - lly
+        ury_flipped = self.canvas.height - ury
+        label = graphics.Text(graphics.Point((llx + urx)/2, (lly_flipped + ury_flipped)/2), label)
+        label.setSize(12)
+        label.setFace("helvetica")
+        label.setTextColor(properties["label_color"])
+        label.draw(self.canvas)
+
+    def begin_group(self, label: str | None,
+                    llx: int, lly: int, urx: int, ury: int,
+                    properties: dict):
+        """Outline the group in red.  Label is not visible."""
+        outline = {"margin": properties["margin"], "fill_color": None, "stroke_color": "red"}
+        self.draw_rect(llx, lly, urx, ury, outline)
+
+    def end_group(self):
+        pass
 
+    def show_tooltip(self, index: spatial.Node, event):
+        """Show labels of the tile and groups under the mouse"""
+        x, y = self.canvas.toWorld(event.x, event.y)
+        # Layout y coordinates are flipped when drawn (see draw_rect)
+        text = " / ".join(spatial.labels_at(index, x, self.canvas.height - y))
+        text = text.replace("\n", " ")
+        if self.tooltip is None:
+            self.tooltip = self.canvas.create_text(0, 0, anchor="nw", font=("helvetica", 12),
+                                                   fill="black")
+        self.canvas.itemconfigure(self.tooltip, text=text)
+        self.canvas.coords(self.tooltip, event.x + 12, event.y + 12)
+        self.canvas.tag_raise(self.tooltip)
 
+    def close(self, index: spatial.Node = None,
+              expand: Callable[[list[spatial.Group]], None] | None = None):
+        """Hold display on screen until user clicks.
+        Meanwhile, if we have a spatial index of the layout,
+        show labels under the mouse as it moves, and
+        expand collapsed groups that are clicked.
+        """
+        if index is not None:
+            self.canvas.bind("<Motion>", lambda event: self.show_tooltip(index, event))
+        if expand is not None:
+            print("Click a collapsed group to expand it, or elsewhere to close the window")
+        else:
+            print("Click window to close it")
+        while True:
+            click = self.canvas.getMouse()
+            path = spatial.hit_test(index, click.x, self.canvas.height - click.y)
+            if expand is None or not path or not spatial.is_collapsed(path[-1]):
+                break
+            expand(path)
+        self.canvas.close()
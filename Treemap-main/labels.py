@@ -0,0 +1,153 @@
+"""Fitting tile labels into the space available for them.
+
+Widths of characters are taken from the font metrics of Helvetica
+(the font we ask for in SVG and Tk), in units of 1/1000 of the font
+size.  A label that is too wide is wrapped at spaces, and words or
+lines that still do not fit are truncated with an ellipsis.  If too
+little would be left to be useful, the label is not shown on the tile
+at all (in SVG it becomes a tool-tip).
+
+The same labels often appear on many tiles of the same size (e.g.,
+one per group in a large treemap), so fit_label remembers its results.
+"""
+
+import functools
+import typing
+import unicodedata
+
+FONT_SIZE_PX = 16      # 12pt
+LINE_HEIGHT_PX = 16    # Lines are 1em apart
+ELLIPSIS = "…"
+
+# Advance widths of Helvetica, from its Adobe font metrics (AFM) file
+HELVETICA_WIDTHS = {
+    " ": 278, "!": 278, '"': 355, "#": 556, "$": 556, "%": 889, "&": 667, "'": 191,
+    "(": 333, ")": 333, "*": 389, "+": 584, ",": 278, "-": 333, ".": 278, "/": 278,
+    "0": 556, "1": 556, "2": 556, "3": 556, "4": 556, "5": 556, "6": 556, "7": 556,
+    "8": 556, "9": 556, ":": 278, ";": 278, "<": 584, "=": 584, ">": 584, "?": 556,
+    "@": 1015, "A": 667, "B": 667, "C": 722, "D": 722, "E": 667, "F": 611, "G": 778,
+    "H": 722, "I": 278, "J": 500, "K": 667, "L": 556, "M": 833, "N": 722, "O": 778,
+    "P": 667, "Q": 778, "R": 722, "S": 667, "T": 611, "U": 722, "V": 667, "W": 944,
+    "X": 667, "Y": 667, "Z": 611, "[": 278, "\\": 278, "]": 278, "^": 469, "_": 556,
+    "`": 333, "a": 556, "b": 556, "c": 500, "d": 556, "e": 556, "f": 278, "g": 556,
+    "h": 556, "i": 222, "j": 222, "k": 500, "l": 222, "m": 833, "n": 556, "o": 556,
+    "p": 556, "q": 556, "r": 333, "s": 500, "t": 278, "u": 556, "v": 500, "w": 722,
+    "x": 500, "y": 500, "z": 500, "{": 334, "|": 260, "}": 334, "~": 584,
+    ELLIPSIS: 1000, "–": 556,
+}
+MIN_SHOWN = 3          # Don't truncate words to fewer characters than this
+DEFAULT_WIDTH = 556    # Typical width of a letter or digit
+WIDE_WIDTH = 1000      # East Asian wide characters
+
+
+def char_width(c: str) -> int:
+    """Advance width of character c, in 1/1000 of the font size"""
+    width = HELVETICA_WIDTHS.get(c)
+    if width is not None:
+        return width
+    if unicodedata.east_asian_width(c) in ("W", "F"):
+        return WIDE_WIDTH
+    return DEFAULT_WIDTH
+
+
+def text_width(line: str) -> float:
+    """Width of one line of text in pixels.
+
+    >>> text_width("Hi")  # 722 + 222 thousandths of 16 pixels
+    15.104
+    """
+    return sum(char_width(c) for c in line) * FONT_SIZE_PX / 1000
+
+
+class Fit(typing.NamedTuple):
+    """How a label will be shown: the lines of text on the tile,
+    and whether some of the label had to be cut off.
+    """
+    lines: tuple[str, ...]
+    truncated: bool
+
+
+def truncate(text: str, width: float) -> str:
+    """The longest prefix of text that fits in width with an ellipsis,
+    or "" if fewer than MIN_SHOWN characters would fit.
+
+    >>> truncate("Computer Science", 60)
+    'Comp…'
+    >>> truncate("Computer Science", 30)
+    ''
+    """
+    limit = width - char_width(ELLIPSIS) * FONT_SIZE_PX / 1000
+    used = 0.0
+    for i, c in enumerate(text):
+        used += char_width(c) * FONT_SIZE_PX / 1000
+        if used > limit:
+            return text[:i] + ELLIPSIS if i >= MIN_SHOWN else ""
+    return text + ELLIPSIS
+
+
+def wrap(line: str, width: float) -> tuple[list[str] | None, bool]:
+    """Break line at spaces into lines no wider than width.
+    Words too wide for a line of their own are truncated.
+    Returns the lines (None if some word cannot be shown at all)
+    and whether any word was truncated.
+
+    >>> wrap("Data Science 33", 100)
+    (['Data Science', '33'], False)
+    """
+    lines = []
+    truncated = False
+    current = ""
+    for word in line.split(" "):
+        candidate = f"{current} {word}" if current else word
+        if text_width(candidate) <= width:
+            current = candidate
+            continue
+        if current:
+            lines.append(current)
+        if text_width(word) <= width:
+            current = word
+        else:
+            current = truncate(word, width)
+            truncated = True
+            if not current:
+                return None, True
+    lines.append(current)
+    return lines, truncated
+
+
+@functools.lru_cache(maxsize=65536)
+def fit_label(label: str, width: int, height: int) -> Fit | None:
+    """Fit label into a box width x height pixels.  Lines of label
+    (separated by newlines) are wrapped and truncated as needed.
+    Returns None if the label cannot be shown in the box at all.
+
+    >>> fit_label("Computer Science\\n79", 200, 40)
+    Fit(lines=('Computer Science', '79'), truncated=False)
+    >>> fit_label("Computer Science\\n79", 80, 40)
+    Fit(lines=('Computer', 'Science…'), truncated=True)
+    >>> fit_label("Computer Science\\n79", 80, 10) is None
+    True
+    """
+    max_lines = height // LINE_HEIGHT_PX
+    if max_lines < 1:
+        return None
+    lines = []
+    truncated = False
+    for line in label.split("\n"):
+        wrapped, cut = wrap(line, width)
+        if wrapped is None:
+            return None
+        lines.extend(wrapped)
+        truncated = truncated or cut
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        last = lines[-1]
+        while text_width(last + ELLIPSIS) > width and last:
+            last = last[:-1]
+        if len(last) < MIN_SHOWN:
+            return None
+        lines[-1] = last + ELLIPSIS
+        truncated = True
+    if not lines[0]:
+        return None
+    return Fit(tuple(lines), truncated)
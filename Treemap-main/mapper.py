@@ -10,62 +10,142 @@ Example use:  python3 mapper.py data/small_flat.json 500 500
 """
 
 # Standard Python library modules
-import logging
 import doctest
 
 # Project modules, provided
 import geometry
 import display
+import spatial
+import profiling
+import metrics
 
-# Enable logging with log.debug(msg), log.info(msg), etc.
-logging.basicConfig()
-log = logging.getLogger(__name__)  # Log messages will look like "DEBUG:mapper:msg"
-log.setLevel(logging.DEBUG)   # Change to logging.INFO to suppress debugging messages
+# Enable logging with log.debug(msg, args), log.info(msg, args), etc.
+# Log messages will look like "DEBUG:mapper:msg"; to see them, run with
+# TREEMAP_LOG=mapper=DEBUG in the environment (see tracing.py)
+import tracing
+log = tracing.logger(__name__)
 
 
 # Layout works with integers, floating point numbers, or a mix of the two.
 Real = int | float    # Named type for use in type annotations
 Nest = Real | list['Nest'] | dict[ str, 'Nest'] | tuple[str, 'Nest']
 
-def treemap(values: list[Real], width: int, height: int):
-    """Create treemap of values in width x height pixel display
-    in Tk interface and in SVG file written to treemap.svg.
+def treemap(values: Nest, width: int, height: int,
+            renderer: display.Display | None = None,
+            viewport: geometry.Rect | None = None,
+            max_depth: int | None = None,
+            timer: profiling.PhaseTimer | None = None) -> spatial.Node:
+    """Create treemap of values in width x height pixel display.
+    By default the renderer is a Tk interface and an SVG file
+    written to treemap.svg; pass another display.Display
+    (e.g., display.svg_only) to render elsewhere.
+    If a viewport is given, only tiles and groups within it are drawn.
+    If max_depth is given, groups nested more deeply are collapsed,
+    and an interactive display (Tk) expands them when clicked.
+    If a timer is given, the "layout" phase (which includes drawing)
+    and the "close" phase (writing files, and waiting for the user to
+    close the Tk window) are timed separately (see profiling.py).
+    Returns the spatial index of the layout (see spatial.py).
     """
-    display.init(width, height)
+    timer = timer or profiling.NULL_TIMER
+    if renderer is None:
+        renderer = display.tk_and_svg(width, height)
     area = geometry.Rect(geometry.Point(0, 0),
                          geometry.Point(width, height))
-    layout(values, area)
-    display.wait_close()
-
-
-
-def layout(nest: Nest, rect: geometry.Rect):
-    """Lay elements of nest out in rectangle.
-    Recursively lays out a nested list of integers
+    with timer.phase("layout"):
+        index = layout(values, area, renderer, viewport, max_depth)
+
+    def expand_in_place(path: list[spatial.Group], medium_renderer: display.Display):
+        group = path[-1]
+        group.child = expand(path, medium_renderer, max_depth)
+        group.nest = None
+
+    with timer.phase("close"):
+        renderer.close(index, expand_in_place if max_depth is not None else None)
+    return index
+
+
+def expand(path: list[spatial.Group], renderer: display.Display,
+           max_depth: int | None = None) -> spatial.Node:
+    """Lay out the nest of a collapsed group, the last element of path
+    (as found by spatial.hit_test), within the group's rectangle, to
+    max_depth more levels.  Earlier elements of path are the enclosing
+    groups, so that coloring by label path matches the whole treemap.
+    Returns the spatial index of the group's contents.
     """
+    *ancestors, group = path
+    assert spatial.is_collapsed(group), f"{group} is not a collapsed group"
+    for ancestor in ancestors:
+        renderer.push_new_color(ancestor.label)
+    rect = geometry.Rect(geometry.Point(group.llx, group.lly),
+                         geometry.Point(group.urx, group.ury))
+    renderer.begin_group(rect, label=group.label)
+    child = layout(group.nest, rect, renderer, None, max_depth)
+    renderer.end_group()
+    for ancestor in ancestors:
+        renderer.pop_color()
+    return child
+
+
+def layout(nest: Nest, rect: geometry.Rect, renderer: display.Display,
+           viewport: geometry.Rect | None = None,
+           max_depth: int | None = None, depth: int = 0) -> spatial.Node:
+    """Lay elements of nest out in rectangle, drawing them with renderer.
+    Recursively lays out a nested list of integers.
+    Parts of nest that fall outside the viewport (if given) are skipped
+    entirely, so the cost of a zoomed view depends on what is visible.
+    Groups at depth max_depth (if given) are collapsed: drawn as a single
+    tile, with their contents left to be laid out later by expand.
+    Top level groups are at depth 0.
+    Returns the tree of splits, groups, and tiles, which serves as
+    a spatial index of the layout.
+    """
+    if metrics.ENABLED:
+        metrics.COUNTS["layout.calls"] += 1
+    if viewport is not None and not rect.intersects(viewport):
+        return None
+
     if isinstance(nest, Real):  # Base case: single number
-        display.draw_tile(rect, label=str(nest))
+        label = str(nest)
+        renderer.draw_tile(rect, label=label)
+        if metrics.ENABLED:
+            metrics.COUNTS["layout.tiles"] += 1
+        return spatial.Tile(rect.ll.x, rect.ll.y, rect.ur.x, rect.ur.y, label)
 
     elif isinstance(nest, list):  # Recursive cases: list of Nests
         if len(nest) == 1:  # Single element list
-            layout(nest[0], rect)
+            return layout(nest[0], rect, renderer, viewport, max_depth, depth)
         elif len(nest) > 1:  # Multiple elements
             left, right = bisect(nest)
             left_rect, right_rect = rect.split(deep_sum(left) / deep_sum(nest))
-            layout(left, left_rect)
-            layout(right, right_rect)
+            first = layout(left, left_rect, renderer, viewport, max_depth, depth)
+            second = layout(right, right_rect, renderer, viewport, max_depth, depth)
+            return spatial.Split(left_rect.ur.x, left_rect.ur.y, first, second)
+        return None
 
     elif isinstance(nest, dict):  # Convert dict to list of tuples
-        layout(list(nest.items()), rect)
+        return layout(list(nest.items()), rect, renderer, viewport, max_depth, depth)
 
     elif isinstance(nest, tuple):  # (label, value) pair
         key, value = nest
         if isinstance(value, Real):  # Single number
-            display.draw_tile(rect, label=f"{key}\n{value}")
+            label = f"{key}\n{value}"
+            renderer.draw_tile(rect, label=label)
+            if metrics.ENABLED:
+                metrics.COUNTS["layout.tiles"] += 1
+            return spatial.Tile(rect.ll.x, rect.ll.y, rect.ur.x, rect.ur.y, label)
+        elif max_depth is not None and depth >= max_depth:  # Collapsed group
+            renderer.begin_group(rect, label=key)
+            renderer.draw_tile(rect, label=key)
+            renderer.end_group()
+            return spatial.Group(rect.ll.x, rect.ll.y, rect.ur.x, rect.ur.y, key, None, value)
         else:  # Nested group
-            display.begin_group(rect, label=key)
-            layout(value, rect)
-            display.end_group()
+            renderer.begin_group(rect, label=key)
+            child = layout(value, rect, renderer, viewport, max_depth, depth + 1)
+            renderer.end_group()
+            if metrics.ENABLED:
+                metrics.COUNTS["layout.groups"] += 1
+            return spatial.Group(rect.ll.x, rect.ll.y, rect.ur.x, rect.ur.y, key, child)
 
     else:
         assert False, f"Unexpected type in layout: {type(nest)}"
@@ -98,6 +178,8 @@ def bisect(li: list[Real]) -> tuple[list[Real], list[Real]]:
     # return li[:i], li[i:]
     assert isinstance(li, list), f"bisect is only for lists, can't split {li}"
     assert len(li) >= 2, f"Cannot bisect {li}; length must be at least 2"
+    if metrics.ENABLED:
+        metrics.COUNTS["bisect.calls"] += 1
 
     total_sum = deep_sum(li)
     target = total_sum / 2
@@ -132,6 +214,8 @@ def deep_sum(nest: Nest) -> Real:
     >>> deep_sum({ "Cake": { "Chocolate": 10, "Carrot": 4 }, "Ice Cream": 15 })
     29
     """
+    if metrics.ENABLED:
+        metrics.COUNTS["deep_sum.calls"] += 1
     if isinstance(nest, dict):  # Convert dict to list of tuples
         nest = list(nest.items())
     
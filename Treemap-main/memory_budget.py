@@ -0,0 +1,130 @@
+"""Predicting how much memory drawing a treemap will take, and
+choosing a way to draw it within a budget.
+
+Memory grows with the number of tiles and groups drawn: each has
+nodes in the spatial index (spatial.py), text in the SVG buffer, and
+objects in the Tk window.  BYTES_PER_NODE are rough figures measured
+with tracemalloc (for Tk, an allowance for the Zelle graphics objects;
+Tk's own canvas items are outside Python and not counted).
+
+If drawing everything would exceed the budget, plan chooses either
+  - a max_depth (see mapper.layout), so that deep groups are drawn
+    collapsed; in the Tk window they can still be expanded by clicking,
+  - or streaming the SVG to its file as it is drawn, without Tk,
+    so that neither the SVG text nor the Tk objects are held in memory,
+preferring the first for interactive use and the second otherwise,
+and combining them if neither alone is enough.
+
+The budget is for memory added by drawing; the nest itself has
+already been read by the time we can count its tiles.
+"""
+
+import typing
+
+import tracing
+log = tracing.logger(__name__)
+
+BYTES_PER_NODE = {"index": 250, "svg": 500, "tk": 1000}
+
+
+class Census(typing.NamedTuple):
+    """Numbers of leaves and of groups within each number of enclosing groups"""
+    leaves: list[int]
+    groups: list[int]
+
+
+class Plan(typing.NamedTuple):
+    max_depth: int | None
+    stream: bool   # Stream SVG, without Tk
+    estimate: int  # Bytes
+
+
+def census(nest) -> Census:
+    """Count leaves and groups of nest by depth, as mapper.layout
+    counts depth (labeled groups, not lists, are levels).
+
+    >>> census({"a": {"b": 1, "c": [2, 3]}, "d": 4})
+    Census(leaves=[1, 1, 2], groups=[1, 1])
+    """
+    leaves, groups = [0], []
+    pending = [(nest, 0)]
+    while pending:
+        item, depth = pending.pop()
+        if isinstance(item, dict):
+            pending.extend((entry, depth) for entry in item.items())
+        elif isinstance(item, list):
+            pending.extend((entry, depth) for entry in item)
+        elif isinstance(item, tuple) and not isinstance(item[1], (int, float)):
+            while len(groups) <= depth:
+                groups.append(0)
+            groups[depth] += 1
+            if len(leaves) <= depth + 1:
+                leaves.append(0)
+            pending.append((item[1], depth + 1))
+        else:
+            leaves[depth] += 1
+    return Census(leaves, groups)
+
+
+def nodes_drawn(counts: Census, max_depth: int | None = None) -> int:
+    """Tiles and groups drawn when groups at max_depth are collapsed.
+    A collapsed group is drawn as a group holding one tile.
+
+    >>> counts = census({"a": {"b": 1, "c": [2, 3]}, "d": 4})
+    >>> nodes_drawn(counts), nodes_drawn(counts, 1), nodes_drawn(counts, 0)
+    (6, 5, 3)
+    """
+    if max_depth is None or max_depth >= len(counts.groups):
+        return sum(counts.leaves) + sum(counts.groups)
+    return (sum(counts.leaves[:max_depth + 1]) + sum(counts.groups[:max_depth])
+            + 2 * counts.groups[max_depth])
+
+
+def estimate(nodes: int, media: list[str]) -> int:
+    """Bytes to draw nodes tiles and groups on media"""
+    return nodes * (BYTES_PER_NODE["index"] + sum(BYTES_PER_NODE[medium] for medium in media))
+
+
+def plan(nest, budget: int, max_depth: int | None = None,
+         interactive: bool = True) -> Plan:
+    """How to draw nest within budget bytes, collapsing groups
+    no deeper than max_depth.
+
+    >>> nest = {"a": {"b": 1, "c": [2, 3]}, "d": 4}
+    >>> plan(nest, 20_000)
+    Plan(max_depth=None, stream=False, estimate=10500)
+    >>> plan(nest, 6_000)
+    Plan(max_depth=0, stream=False, estimate=5250)
+    >>> plan(nest, 1_000, interactive=False)
+    Plan(max_depth=0, stream=True, estimate=750)
+    """
+    counts = census(nest)
+    media = ["svg", "tk"] if interactive else ["svg"]
+
+    def within(depth: int | None, media: list[str]) -> int | None:
+        """Estimate if drawing to depth on media fits in budget, else None"""
+        needed = estimate(nodes_drawn(counts, depth), media)
+        return needed if needed <= budget else None
+
+    needed = within(max_depth, media)
+    if needed is not None:
+        return Plan(max_depth, False, needed)
+    log.warning(f"Drawing needs about {estimate(nodes_drawn(counts, max_depth), media) / 2 ** 20:.1f} MB, "
+                f"over budget of {budget / 2 ** 20:.1f} MB")
+    limit = len(counts.groups) if max_depth is None else min(max_depth, len(counts.groups))
+    shallower = range(limit - 1, -1, -1)
+    if interactive:
+        for depth in shallower:
+            needed = within(depth, media)
+            if needed is not None:
+                log.warning(f"Collapsing groups at depth {depth}")
+                return Plan(depth, False, needed)
+    log.warning("Streaming SVG without Tk display")
+    for depth in [max_depth, *shallower]:
+        needed = within(depth, [])
+        if needed is not None:
+            if depth != max_depth:
+                log.warning(f"Collapsing groups at depth {depth}")
+            return Plan(depth, True, needed)
+    log.warning("Over budget even with top level groups collapsed")
+    return Plan(0, True, estimate(nodes_drawn(counts, 0), []))
@@ -0,0 +1,50 @@
+"""Counts of work done in the hot paths of treemap: layout steps,
+splits, weighing, colors chosen, SVG elements and bytes.  Where
+profiling.py tells how long each phase took, these counts tell how
+much work there was, e.g., to size machines for a workload.
+
+Counting is off unless enabled, by enable() or by setting environment
+variable TREEMAP_METRICS=1.  Each place that counts is guarded by
+"if metrics.ENABLED:", so when counting is off it costs only that
+test.  Work done once, while modules are loaded (e.g., building the
+color palette), is noted whether or not counting is on, and is part
+of every snapshot taken with counting on.
+
+Example:
+    metrics.enable()
+    mapper.treemap(values, 800, 600, renderer)
+    print(metrics.snapshot())   # {"layout.calls": 99, "rect.split": 49, ...}
+"""
+
+import collections
+import os
+
+ENABLED = os.environ.get("TREEMAP_METRICS", "") not in ("", "0")
+
+COUNTS: collections.Counter = collections.Counter()
+NOTED: dict[str, int] = {}      # Counts of work done once; not reset
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    COUNTS.clear()
+
+
+def note(name: str, count: int):
+    """Record count of work done once, e.g., at import"""
+    NOTED[name] = count
+
+
+def snapshot() -> dict[str, int]:
+    """Current counts, by name, with noted counts if counting is on"""
+    counts = dict(COUNTS, **NOTED) if ENABLED else COUNTS
+    return dict(sorted(counts.items()))
@@ -0,0 +1,173 @@
+"""Treemaps too big for one picture, as a pyramid of map tiles.
+
+The nest is laid out once, on a square virtual canvas of
+tile_size * 2**max_zoom pixels.  Zoom level z divides that canvas
+into 2**z x 2**z tiles of tile_size x tile_size pixels, each written
+as an SVG file z/x/y.svg (x counting columns from the left, y rows
+from the top), the layout used by "slippy map" viewers such as Leaflet:
+   L.tileLayer("out/{z}/{x}/{y}.svg", {maxZoom: 6}).addTo(map)
+
+Each tile is drawn from the spatial index of the layout (spatial.py),
+visiting only the parts of the index that overlap the tile.  At low
+zoom levels, groups and tiles smaller than MIN_PX pixels are drawn as
+a single filled rectangle rather than visited, so that the work per
+tile stays bounded however many tiles the treemap has.  Tiles of the
+pyramid are drawn in a pool of worker processes.  Colors are chosen
+by label path, so that each part of the treemap has the same color
+in every tile at every zoom level.
+
+Example use:
+   python3 pyramid.py data/majors-23F.json out --max-zoom 4
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+
+import mapper
+import display
+import geometry
+import spatial
+
+import tracing
+log = tracing.logger(__name__)
+
+TILE_SIZE = 256  # Pixels, as usual for map tiles
+MIN_PX = 10      # Smaller parts of the layout are not drawn in detail
+
+
+class NoDisplay:
+    """Renderer for laying out without drawing"""
+    def draw_tile(self, r: geometry.Rect, label: str | None = None):
+        pass
+
+    def begin_group(self, r: geometry.Rect, label: str | None = None):
+        pass
+
+    def end_group(self):
+        pass
+
+    def close(self, index=None, expand=None):
+        pass
+
+
+class TileView:
+    """Maps layout coordinates of one tile of the pyramid
+    to pixel coordinates of its image.
+    """
+    def __init__(self, z: int, x: int, y: int, canvas_size: int, tile_size: int):
+        span = canvas_size / 2 ** z   # Layout units per tile
+        self.llx, self.lly = x * span, y * span
+        self.urx, self.ury = self.llx + span, self.lly + span
+        self.scale = tile_size / span
+
+    def overlaps(self, llx: float, lly: float, urx: float, ury: float) -> bool:
+        return llx < self.urx and self.llx < urx and lly < self.ury and self.lly < ury
+
+    def rect(self, llx: float, lly: float, urx: float, ury: float) -> geometry.Rect:
+        """Pixel rectangle of a layout rectangle"""
+        return geometry.Rect(
+            geometry.Point(round((llx - self.llx) * self.scale), round((lly - self.lly) * self.scale)),
+            geometry.Point(round((urx - self.llx) * self.scale), round((ury - self.lly) * self.scale)))
+
+    def too_small(self, llx: float, lly: float, urx: float, ury: float) -> bool:
+        return min(urx - llx, ury - lly) * self.scale < MIN_PX
+
+
+def replay(node: spatial.Node, llx: int, lly: int, urx: int, ury: int,
+           view: TileView, renderer: display.Display):
+    """Draw the part of the layout in index node, which covers
+    rectangle (llx, lly, urx, ury), that overlaps view.
+    """
+    if node is None or not view.overlaps(llx, lly, urx, ury):
+        return
+    if isinstance(node, spatial.Split):
+        if view.too_small(llx, lly, urx, ury):
+            renderer.draw_tile(view.rect(llx, lly, urx, ury))
+            return
+        replay(node.first, llx, lly, node.first_urx, node.first_ury, view, renderer)
+        # geometry.Rect.split cuts either the height or the width
+        if node.first_ury < ury:
+            replay(node.second, llx, node.first_ury, urx, ury, view, renderer)
+        else:
+            replay(node.second, node.first_urx, lly, urx, ury, view, renderer)
+    elif isinstance(node, spatial.Tile):
+        renderer.draw_tile(view.rect(llx, lly, urx, ury), label=node.label)
+    elif spatial.is_collapsed(node) or view.too_small(llx, lly, urx, ury):
+        r = view.rect(llx, lly, urx, ury)
+        renderer.begin_group(r, label=node.label)
+        renderer.draw_tile(r, label=node.label)
+        renderer.end_group()
+    else:
+        renderer.begin_group(view.rect(llx, lly, urx, ury), label=node.label)
+        replay(node.child, llx, lly, urx, ury, view, renderer)
+        renderer.end_group()
+
+
+# The layout, set in each worker process by init_worker
+INDEX: spatial.Node = None
+CANVAS_SIZE = 0
+
+
+def init_worker(index: spatial.Node, canvas_size: int):
+    global INDEX, CANVAS_SIZE
+    INDEX, CANVAS_SIZE = index, canvas_size
+
+
+def render_tile(out_dir: str, tile_size: int, z: int, x: int, y: int) -> str:
+    """Write tile z/x/y of the pyramid, returning its path"""
+    path = os.path.join(out_dir, str(z), str(x), f"{y}.svg")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    renderer = display.svg_only(tile_size, tile_size, path, coloring="path")
+    view = TileView(z, x, y, CANVAS_SIZE, tile_size)
+    replay(INDEX, 0, 0, CANVAS_SIZE, CANVAS_SIZE, view, renderer)
+    renderer.close()
+    return path
+
+
+def pyramid(values: mapper.Nest, out_dir: str, max_zoom: int,
+            tile_size: int = TILE_SIZE, workers: int | None = None) -> int:
+    """Lay out values once and write tiles of zoom levels 0..max_zoom
+    under out_dir.  Returns the number of tiles written.
+    """
+    canvas_size = tile_size * 2 ** max_zoom
+    begin = time.perf_counter()
+    index = mapper.treemap(values, canvas_size, canvas_size, NoDisplay())
+    log.info(f"Laid out {canvas_size} x {canvas_size} canvas in {time.perf_counter() - begin:.2f}s")
+    tiles = [(z, x, y) for z in range(max_zoom + 1)
+             for x in range(2 ** z) for y in range(2 ** z)]
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=init_worker, initargs=(index, canvas_size)) as pool:
+        futures = [pool.submit(render_tile, out_dir, tile_size, z, x, y) for z, x, y in tiles]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    log.info(f"Wrote {len(tiles)} tiles to {out_dir} in {time.perf_counter() - begin:.2f}s")
+    return len(tiles)
+
+
+def cli() -> object:
+    """Obtain input file and options from the command line."""
+    parser = argparse.ArgumentParser("Write a treemap as a pyramid of map tiles")
+    parser.add_argument("input", help="Data input in json format",
+                        type=argparse.FileType("r"))
+    parser.add_argument("out_dir", help="Directory for tiles z/x/y.svg")
+    parser.add_argument("--max-zoom", type=int, default=4,
+                        help="Deepest zoom level; the canvas is tile size * 2**max_zoom pixels square")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE,
+                        help="Width and height of each tile in pixels")
+    parser.add_argument("--workers", type=int,
+                        help="Number of worker processes (default: one per CPU)")
+    return parser.parse_args()
+
+
+def main():
+    tracing.configure()
+    args = cli()
+    values = json.load(args.input)
+    pyramid(values, args.out_dir, args.max_zoom, args.tile_size, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,15 +13,28 @@ import json
 import argparse
 import io
 
+import heapq
+import itertools
 import logging
 import numbers
+import operator
+import os
 import sys
+import tempfile
+from typing import Iterable, Iterator
 
+import columns
+import chunked
+import checkpoint
 
-logging.basicConfig()
+
+# Messages use %-style arguments, so they are formatted only if shown
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
+# Groups summed in memory before spilling to a run file, with --unsorted
+MAX_GROUPS = 1_000_000
+
 def cli() -> object:
     """Command line interface"""
     parser = argparse.ArgumentParser("Summarize CSV file on selected columns")
@@ -33,9 +46,21 @@ def cli() -> object:
                         )
     parser.add_argument("--by", type=str,
                         help="Field to summarize by (break at changes in this or prior columns as defined in schema)")
-    parser.add_argument("output", type=argparse.FileType(mode="w"),
-                        nargs="?", default=sys.stdout,
-                        help="Summarized CSV file")
+    parser.add_argument("--unsorted", action="store_true",
+                        help="Input need not be sorted by the summarized fields; output is sorted")
+    parser.add_argument("--max-groups", type=int, default=MAX_GROUPS,
+                        help="With --unsorted, groups to hold in memory before spilling to a temporary file")
+    parser.add_argument("--jobs", type=int,
+                        help="Parse the input file in chunks in this many processes")
+    parser.add_argument("--rollup", metavar="OUTPUT",
+                        help="Summarize by each label field (up to --by) in one pass, "
+                             "writing to OUTPUT with {level} replaced by the field, "
+                             "or to the one file OUTPUT with a column 'by' naming the field")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="Save sums in FILE, and on later runs read only rows "
+                             "appended to the input file since")
+    parser.add_argument("output", nargs="?", default="-",
+                        help="Summarized CSV file (default: standard output)")
     args = parser.parse_args()
     return args
 
@@ -49,23 +74,13 @@ def control_field_labels(label_fields: list[str], summarize_by_field: str) -> li
     raise ValueError(f"Field {summarize_by_field} not in schema label fields {label_fields}")
 
 
-def is_control_break(record: dict[str, object], control_fields: list[str], current_values: list[str]) -> bool:
-    """Does a non-empty field of the record differ
-    from current values for one of the control fields?
-    """
-    for i, key in enumerate(control_fields):
-        if record[key] and record[key] != current_values[i]:
-            return True
-    return False
-
-
 def load_schema(schema_file: io.IOBase) -> dict[str, list[str]]:
     """Configuration options we expect:
        "labels" -> non-empty list of column headers
        "values" -> non-empty list of column headers
     """
     schema = json.load(schema_file)
-    log.debug(f"Schema: \n{schema}")
+    log.debug("Schema: \n%s", schema)
     assert isinstance(schema, dict), f"Schema should be a dict with entries 'labels' and 'data'"
     return schema
 
@@ -84,52 +99,435 @@ def guess_numeric_value(field: str) -> object:
 
 
 
+def records(in_csv: io.IOBase, control_fields: list[str],
+            data_fields: list[str]) -> Iterator[tuple[tuple[str, ...], list]]:
+    """Control field labels and numeric data values of each row of in_csv.
+    Empty labels are "sticky", i.e., repeat the label of the row before.
+    """
+    reader = csv.reader(in_csv)
+    header = next(reader, [])
+    # Labels of the first row are taken as they are (missing as empty)
+    return sticky_records(columns.rows(reader, len(header)), header, control_fields, data_fields,
+                          ["" for label in control_fields])
+
+
+def sticky_records(rows: Iterable[list[str | None]], header: list[str],
+                   control_fields: list[str], data_fields: list[str],
+                   row_labels: list[str | None]) -> Iterator[tuple[tuple[str, ...], list]]:
+    """Control field labels and numeric data values of each of rows,
+    empty labels repeating the label of the row before, or of row_labels
+    before the first row.  row_labels is updated in place.
+    """
+    # Fields are taken by position, found once from the header
+    control_values = columns.fields(columns.indexes(header, control_fields))
+    data_values = columns.fields(columns.indexes(header, data_fields))
+    # As guess_numeric_value, but choosing int or float once per column
+    convert = columns.Converters(guess_numeric_value, len(data_fields), blank_value=0)
+
+    for row in rows:
+        for i, label in enumerate(control_values(row)):
+            if label:  # Retain "sticky" values when field is empty
+                row_labels[i] = label
+        log.debug("Labels effectively %s", row_labels)
+        yield tuple(row_labels), convert(data_values(row))
+
+
+def control_breaks(rows: Iterable[tuple[tuple[str, ...], list]]) -> Iterator[tuple[tuple[str, ...], list]]:
+    """Sums of runs of consecutive rows with the same labels.
+    If rows are sorted by labels, each run is a whole group.
+    """
+    current, sums = None, None
+    for labels, values in rows:
+        if labels != current:
+            if current is not None:
+                yield current, sums
+            current, sums = labels, values
+        else:
+            for i, value in enumerate(values):
+                sums[i] += value
+    ## Treat EOF as a control break
+    if current is not None:
+        yield current, sums
+
+
+def write_run(groups: Iterable[tuple[tuple[str, ...], list]]) -> str:
+    """Write groups, in the order given, to a temporary file of JSON lines.
+    Returns its path: the file is named, so that another process (e.g., the
+    parent of a --jobs worker) can read it, and is removed by remove_runs.
+    """
+    with tempfile.NamedTemporaryFile(mode="w", encoding="utf-8", suffix=".run",
+                                     delete=False) as run:
+        for labels, sums in groups:
+            run.write(json.dumps([labels, sums]))
+            run.write("\n")
+    return run.name
+
+
+def spill(groups: dict[tuple[str, ...], list]) -> str:
+    """Write groups, sorted by labels, to a run file; returns its path"""
+    return write_run((labels, groups[labels]) for labels in sorted(groups))
+
+
+def read_run(path: str) -> Iterator[tuple[tuple[str, ...], list]]:
+    with open(path, encoding="utf-8") as run:
+        for line in run:
+            labels, sums = json.loads(line)
+            yield tuple(labels), sums
+
+
+def remove_runs(runs: list[str]):
+    for run in runs:
+        try:
+            os.remove(run)
+        except FileNotFoundError:
+            pass
+
+
+def hashed_runs(rows: Iterable[tuple[tuple[str, ...], list]],
+                max_groups: int = MAX_GROUPS) -> tuple[dict[tuple[str, ...], list], list[str]]:
+    """Sums of groups of rows with the same labels, kept in a dict; when it
+    holds more than max_groups groups, they are spilled to a sorted run
+    file.  Returns the groups not spilled and the paths of the runs.
+    """
+    groups: dict[tuple[str, ...], list] = {}
+    runs = []
+    try:
+        for labels, values in rows:
+            sums = groups.get(labels)
+            if sums is None:
+                groups[labels] = values
+                if len(groups) > max_groups:
+                    log.info("Spilling %d groups to run %d", len(groups), len(runs) + 1)
+                    runs.append(spill(groups))
+                    groups = {}
+            else:
+                for i, value in enumerate(values):
+                    sums[i] += value
+    except BaseException:
+        remove_runs(runs)
+        raise
+    return groups, runs
+
+
+def merged_runs(runs: list[str], *in_memory: Iterable[tuple[tuple[str, ...], list]]
+                ) -> Iterator[tuple[tuple[str, ...], list]]:
+    """Sums of groups of the sorted run files and sorted in_memory groups,
+    in order of labels.  The run files are removed when done.
+    """
+    merged = heapq.merge(*(read_run(run) for run in runs), *in_memory, key=operator.itemgetter(0))
+    # Partial sums of a group from different runs are adjacent after merging
+    try:
+        yield from control_breaks(merged)
+    finally:
+        remove_runs(runs)
+
+
+def hashed_groups(rows: Iterable[tuple[tuple[str, ...], list]],
+                  max_groups: int = MAX_GROUPS) -> Iterator[tuple[tuple[str, ...], list]]:
+    """Sums of groups of rows with the same labels, in order of labels,
+    whatever the order of rows.  Sums are kept in a dict; when it holds
+    more than max_groups groups, they are spilled to a sorted run file,
+    and the runs are merged at the end, as in an external sort.
+    """
+    groups, runs = hashed_runs(rows, max_groups)
+    in_memory = ((labels, groups[labels]) for labels in sorted(groups))
+    if not runs:
+        yield from in_memory
+        return
+    yield from merged_runs(runs, in_memory)
+
+
+def summarize_chunk(path: str, start: int, end: int, header: list[str],
+                    control_fields: list[str], data_fields: list[str],
+                    unsorted: bool, max_groups: int) -> tuple[list, list, list, list]:
+    """Sums of the rows of CSV file path in byte range start..end (see
+    chunked.py).  Returns rows whose labels are not all known in the
+    chunk, as (labels, values) with None for unknown labels; groups of
+    the other rows, as summarize would find them; paths of sorted run
+    files holding the groups instead, if unsorted and there are more
+    than max_groups of them; and the last labels of the chunk.
+    """
+    row_labels = [None for label in control_fields]
+    rows = sticky_records(chunked.rows(path, start, end, len(header)), header,
+                          control_fields, data_fields, row_labels)
+    pending = []
+    for labels, values in rows:
+        if None in labels:
+            pending.append((labels, values))
+        else:
+            rows = itertools.chain([(labels, values)], rows)
+            break
+    if not unsorted:
+        return pending, list(control_breaks(rows)), [], row_labels
+    groups, runs = hashed_runs(rows, max_groups)
+    if runs:
+        # Not returned whole, as that would hold them all in the parent
+        runs.append(spill(groups))
+        return pending, [], runs, row_labels
+    return pending, [(labels, groups[labels]) for labels in sorted(groups)], [], row_labels
+
+
+def parallel_records(path: str, control_fields: list[str], data_fields: list[str],
+                     jobs: int, unsorted: bool = False,
+                     max_groups: int = MAX_GROUPS) -> Iterator[tuple[tuple[str, ...], list]]:
+    """Groups of CSV file path, as control_breaks(records(...)) would
+    find them or, if unsorted, hashed_groups(records(...)), parsing
+    chunks of the file in jobs processes.
+    """
+    header, data_start = chunked.header(path)
+    carried = ["" for label in control_fields]
+    results = chunked.map_chunks(path, data_start, jobs, summarize_chunk, header,
+                                 control_fields, data_fields, unsorted, max_groups)
+    if not unsorted:
+        def in_order() -> Iterator[tuple[tuple[str, ...], list]]:
+            for pending, groups, runs, last in results:
+                for labels, values in pending:
+                    yield tuple(chunked.resolve(labels, carried)), values
+                yield from groups
+                chunked.carry(carried, last)
+        # Groups continuing across chunks are adjacent, and summed again
+        yield from control_breaks(in_order())
+        return
+    runs = []
+    held, held_groups = [], 0   # Sorted groups of chunks, up to max_groups in all
+    resolved = []
+    try:
+        for pending, groups, chunk_runs, last in results:
+            resolved.extend((tuple(chunked.resolve(labels, carried)), values)
+                            for labels, values in pending)
+            runs.extend(chunk_runs)
+            held.append(groups)
+            held_groups += len(groups)
+            if held_groups > max_groups:
+                log.info("Spilling groups of %d chunks to run %d", len(held), len(runs) + 1)
+                runs.append(write_run(control_breaks(heapq.merge(*held, key=operator.itemgetter(0)))))
+                held, held_groups = [], 0
+            chunked.carry(carried, last)
+    except BaseException:
+        remove_runs(runs)
+        raise
+    yield from merged_runs(runs, *held, hashed_groups(resolved, max_groups))
+
+
+def input_path(in_csv: io.IOBase) -> str | None:
+    """Path of the file in_csv reads, or None if it is not a regular file (e.g., stdin)"""
+    name = getattr(in_csv, "name", None)
+    return name if isinstance(name, str) and os.path.isfile(name) else None
+
+
+def serial_unless_file(in_csv: io.IOBase, jobs: int | None) -> int | None:
+    """jobs, or None if in_csv cannot be reopened to be read in chunks"""
+    if jobs and input_path(in_csv) is None:
+        log.warning("Input is not a file; parsing it in one process")
+        return None
+    return jobs
+
+
 def summarize(in_csv: io.IOBase,
               control_fields: list[str], data_fields: list[str],
-              out_csv: io.IOBase):
+              out_csv: io.IOBase, unsorted: bool = False,
+              max_groups: int = MAX_GROUPS, jobs: int | None = None):
     """Summarize CSV file on control fields,
     i.e., accumulate sums when non-empty control field labels match current state, 
     emit and reinitialize when there is a change.
+    If unsorted, rows need not be in order of control fields:
+    each group is summed wherever its rows are, and output in order of
+    control fields, as if the input had been sorted first.
+    With jobs, in_csv (if a file) is parsed in chunks in that many processes.
     """
-    reader = csv.DictReader(in_csv)
+    jobs = serial_unless_file(in_csv, jobs)
     writer = csv.writer(out_csv)
     # Write column headers on output
     writer.writerow(control_fields + data_fields)
+    if jobs:
+        groups = parallel_records(in_csv.name, control_fields, data_fields, jobs, unsorted, max_groups)
+    else:
+        rows = records(in_csv, control_fields, data_fields)
+        groups = hashed_groups(rows, max_groups) if unsorted else control_breaks(rows)
+    for labels, sums in groups:
+        writer.writerow([*labels, *sums])
 
-    row_labels = ["NA" for label in control_fields]
-    sums = [0 for label in data_fields]
 
-    input_records = iter(reader)  # Lets me special case first row
+def summarize_incremental(in_path: str,
+                          control_fields: list[str], data_fields: list[str],
+                          out_path: str, checkpoint_path: str, unsorted: bool = False):
+    """Summarize CSV file in_path to out_path as summarize would, for an
+    input that only grows by appending rows.  Sticky labels and sums not
+    yet final are saved in checkpoint_path, so that the next call reads
+    only the rows appended since.  Sorted, the last group is saved, and
+    the groups before it are kept in out_path; if unsorted, every group
+    is saved, and out_path is rewritten.
+    """
+    header, data_start = chunked.header(in_path)
+    settings = {"control_fields": control_fields, "data_fields": data_fields,
+                "unsorted": unsorted, "output": os.path.abspath(out_path)}
+    saved = checkpoint.load(checkpoint_path, in_path, settings)
+    if saved is not None and not unsorted and (
+            not os.path.exists(out_path) or os.path.getsize(out_path) < saved[1]["output_offset"]):
+        log.warning("%s is not as checkpoint %s left it; reading %s from the start",
+                    out_path, checkpoint_path, in_path)
+        saved = None
+    if saved is None:
+        offset, state = data_start, {"labels": ["" for label in control_fields]}
+    else:
+        offset, state = saved
+    end = max(offset, checkpoint.complete_end(in_path))
+    row_labels = state["labels"]
+    rows = sticky_records(chunked.rows(in_path, offset, end, len(header)), header,
+                          control_fields, data_fields, row_labels)
 
-    ## First row
-    record = next(input_records)
-    row_labels = [record[label] for label in control_fields]
-    sums = [guess_numeric_value(record[col]) for col in data_fields]
+    if unsorted:
+        groups = {tuple(labels): sums for labels, sums in state.get("groups", [])}
+        for labels, values in rows:
+            sums = groups.get(labels)
+            if sums is None:
+                groups[labels] = values
+            else:
+                for i, value in enumerate(values):
+                    sums[i] += value
+        with open(out_path, "w", newline="") as out_csv:
+            writer = csv.writer(out_csv)
+            writer.writerow(control_fields + data_fields)
+            for labels in sorted(groups):
+                writer.writerow([*labels, *groups[labels]])
+        state = {"labels": row_labels, "groups": [[labels, sums] for labels, sums in groups.items()]}
+    else:
+        if saved is None:
+            out_csv = open(out_path, "w", newline="")
+            csv.writer(out_csv).writerow(control_fields + data_fields)
+        else:
+            # Drop the last group as written before; it may have grown
+            out_csv = open(out_path, "r+", newline="")
+            out_csv.truncate(state["output_offset"])
+            out_csv.seek(state["output_offset"])
+        if state.get("open"):
+            labels, sums = state["open"]
+            rows = itertools.chain([(tuple(labels), sums)], rows)
+        with out_csv:
+            writer = csv.writer(out_csv)
+            last = None
+            for group in control_breaks(rows):
+                if last is not None:
+                    writer.writerow([*last[0], *last[1]])
+                last = group
+            output_offset = out_csv.tell()
+            if last is not None:
+                writer.writerow([*last[0], *last[1]])
+        state = {"labels": row_labels, "open": None if last is None else list(last),
+                 "output_offset": output_offset}
+    checkpoint.save(checkpoint_path, in_path, end, settings, state)
 
-    ## Subsequent rows
-    for record in input_records:
-        if is_control_break(record, control_fields, row_labels):
-            writer.writerow(row_labels + sums)
-            sums = [0 for label in data_fields]
-        for i,label in enumerate(control_fields):
-            if record[label]:  # Retain "sticky" values when field is empty
-                row_labels[i] = record[label]
-            log.debug(f"Labels effectively {row_labels}")
-        for i, value_column in enumerate(data_fields):
-            sums[i] += guess_numeric_value(record[value_column])
 
+def rollup(rows: Iterable[tuple[tuple[str, ...], list]],
+           depth: int) -> Iterator[tuple[tuple[str, ...], list]]:
+    """Sums by each prefix of the labels of rows, from one label to
+    depth labels, as control breaks at every level at once.  The sums
+    of each group are produced when it ends, so a group comes after
+    the groups within it.
+    """
+    # open_groups[k] is (labels, sums) of the group of the first k labels
+    open_groups: list[tuple[tuple[str, ...], list] | None] = [None] * (depth + 1)
+    for labels, values in rows:
+        for k in range(depth, 0, -1):
+            group = open_groups[k]
+            if group is not None and group[0] != labels[:k]:
+                yield group
+                open_groups[k] = None
+        for k in range(1, depth + 1):
+            group = open_groups[k]
+            if group is None:
+                open_groups[k] = (labels[:k], list(values))
+            else:
+                sums = group[1]
+                for i, value in enumerate(values):
+                    sums[i] += value
     ## Treat EOF as a control break
-    writer.writerow(row_labels + sums)
+    for k in range(depth, 0, -1):
+        if open_groups[k] is not None:
+            yield open_groups[k]
+
+
+def summarize_rollup(in_csv: io.IOBase,
+                     control_fields: list[str], data_fields: list[str],
+                     out_csvs: list[io.IOBase], unsorted: bool = False,
+                     max_groups: int = MAX_GROUPS, jobs: int | None = None,
+                     tagged: bool = False):
+    """Summarize CSV file on each prefix of control fields in one pass,
+    as summarize would on control_fields[:1], control_fields[:2], ...
+    Sums on the first k control fields are written to out_csvs[k - 1].
+    If tagged, sums on every prefix are written to the one file
+    out_csvs[0], with a first column "by" naming the last field of the prefix.
+    With jobs, in_csv (if a file) is parsed in chunks in that many processes.
+    """
+    expected = 1 if tagged else len(control_fields)
+    if len(out_csvs) != expected:
+        raise ValueError(f"Rollup on {len(control_fields)} fields needs {expected} outputs, "
+                         f"not {len(out_csvs)}")
+    jobs = serial_unless_file(in_csv, jobs)
+    writers = [csv.writer(out_csv) for out_csv in out_csvs]
+    if tagged:
+        writers[0].writerow(["by"] + control_fields + data_fields)
+        writers = writers * len(control_fields)
+    else:
+        for k, writer in enumerate(writers, start=1):
+            writer.writerow(control_fields[:k] + data_fields)
+    if jobs:
+        rows = parallel_records(in_csv.name, control_fields, data_fields, jobs, unsorted, max_groups)
+    else:
+        rows = records(in_csv, control_fields, data_fields)
+        if unsorted:
+            rows = hashed_groups(rows, max_groups)
+    for labels, sums in rollup(rows, len(control_fields)):
+        if tagged:
+            padding = [""] * (len(control_fields) - len(labels))
+            writers[0].writerow([control_fields[len(labels) - 1], *labels, *padding, *sums])
+        else:
+            writers[len(labels) - 1].writerow([*labels, *sums])
 
 
 def main():
+    logging.basicConfig()
     args = cli()
     schema = load_schema(args.schema)
-    log.debug(f"Schema: {map}")
+    log.debug("Schema: %s", map)
     sum_by_field = args.by
-    control_fields = control_field_labels(schema["labels"], sum_by_field)
+    if sum_by_field is None and args.rollup:
+        control_fields = schema["labels"]
+    else:
+        control_fields = control_field_labels(schema["labels"], sum_by_field)
     data_fields = schema["values"]
-    summarize(args.input, control_fields, data_fields, args.output)
+    if (args.jobs or args.checkpoint) and input_path(args.input) is None:
+        raise ValueError("--jobs and --checkpoint need the input to be a file")
+    if args.rollup and args.checkpoint:
+        raise ValueError("--checkpoint cannot be combined with --rollup")
+    if args.rollup:
+        # One file per level, or one file for all levels if the name has no {level}
+        tagged = "{level}" not in args.rollup
+        if tagged:
+            names = [args.rollup]
+        else:
+            names = [args.rollup.format(level=field) for field in control_fields]
+        out_csvs = [open(name, "w", newline="") for name in names]
+        try:
+            summarize_rollup(args.input, control_fields, data_fields, out_csvs,
+                             unsorted=args.unsorted, max_groups=args.max_groups, jobs=args.jobs,
+                             tagged=tagged)
+        finally:
+            for out_csv in out_csvs:
+                out_csv.close()
+    elif args.checkpoint:
+        if args.jobs or args.output == "-":
+            raise ValueError("--checkpoint needs an output file, and cannot be combined with --jobs")
+        args.input.close()
+        summarize_incremental(args.input.name, control_fields, data_fields, args.output,
+                              args.checkpoint, unsorted=args.unsorted)
+    elif args.output == "-":
+        summarize(args.input, control_fields, data_fields, sys.stdout,
+                  unsorted=args.unsorted, max_groups=args.max_groups, jobs=args.jobs)
+    else:
+        with open(args.output, "w") as out_csv:
+            summarize(args.input, control_fields, data_fields, out_csv,
+                      unsorted=args.unsorted, max_groups=args.max_groups, jobs=args.jobs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+"""Checkpoints for CSV files that only grow by appending rows, so that
+a rerun reads just the rows added since the last run.
+
+A checkpoint is a JSON file recording how far the input was read
+(a byte offset, just after a whole line), a digest of the bytes just
+before that offset, the settings of the run, and whatever state the
+program needs to go on from there (sticky labels, sums, a tree).  If
+the input no longer has the same bytes before the offset, or the
+settings differ, the checkpoint is ignored and the input is read from
+the start.
+
+A last line without a newline may still be being written, so it is
+left for the next run.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+DIGEST_BYTES = 4096   # Bytes before the offset that must be unchanged
+
+
+def digest(path: str, offset: int) -> str:
+    """Digest of the DIGEST_BYTES bytes of path before offset"""
+    start = max(0, offset - DIGEST_BYTES)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def complete_end(path: str) -> int:
+    """Offset just after the last newline of path"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        position = size
+        while position > 0:
+            start = max(0, position - DIGEST_BYTES)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+def load(checkpoint_path: str, input_path: str, settings: dict) -> tuple[int, dict] | None:
+    """Offset and state saved for input_path by a run with the same
+    settings, or None if there is no checkpoint or it does not fit the input.
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        saved = json.load(f)
+    if saved["settings"] != settings:
+        log.warning("Checkpoint %s was made with other settings; reading %s from the start",
+                    checkpoint_path, input_path)
+        return None
+    offset = saved["offset"]
+    if os.path.getsize(input_path) < offset or digest(input_path, offset) != saved["digest"]:
+        log.warning("%s has changed, not just grown, since checkpoint %s; reading from the start",
+                    input_path, checkpoint_path)
+        return None
+    log.info("Resuming %s from byte %d", input_path, offset)
+    return offset, saved["state"]
+
+
+def save(checkpoint_path: str, input_path: str, offset: int, settings: dict, state: dict):
+    """Record that input_path has been read up to offset, with state"""
+    saved = {"settings": settings, "offset": offset,
+             "digest": digest(input_path, offset), "state": state}
+    temporary = checkpoint_path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(saved, f)
+    os.replace(temporary, checkpoint_path)   # Never leave half a checkpoint
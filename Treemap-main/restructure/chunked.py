@@ -0,0 +1,138 @@
+"""Reading a large CSV file in parallel, as byte ranges ("chunks")
+parsed in a pool of worker processes.
+
+Chunks end on record boundaries: a newline outside quotes, i.e.,
+preceded by an even number of quote characters since the start of
+the file (a quote within a quoted field is doubled, so it does not
+change the count's parity).  Counting quotes is one pass over the
+bytes in C, much faster than parsing.
+
+Labels in our files are "sticky": an empty label repeats the label
+of the row before, which may be in an earlier chunk.  Each worker
+starts with every label unknown (None).  Rows whose labels are not
+all known are returned as pending, along with the chunk's last
+labels; the main process fills in pending rows from the last labels
+of the chunks before, in order.  Once each label column has had a
+value in a chunk, its rows are complete, so pending rows are usually
+few.
+
+Example (see csv_to_json.unflatten_parallel):
+    header, data_start = chunked.header(path)
+    for result in chunked.map_chunks(path, data_start, jobs, work, ...):
+        ...   # results of work(path, start, end, ...) in order of chunks
+"""
+
+import concurrent.futures
+import csv
+import io
+import os
+from typing import Callable, Iterator
+
+import columns
+
+BLOCK = 1 << 20         # Bytes read at a time when looking for record boundaries
+CHUNKS_PER_JOB = 4      # More chunks than workers, so that workers finish together
+
+
+def record_starts(path: str, targets: list[int]) -> list[int]:
+    """For each of (ascending) byte offsets targets, the offset just
+    after the first record boundary of path at or after it (or the
+    file size, if there is none).
+    """
+    starts = []
+    pending = iter(targets)
+    target = next(pending, None)
+    quotes = 0          # Quote characters counted so far
+    block_start = 0
+    with open(path, "rb") as f:
+        while target is not None:
+            block = f.read(BLOCK)
+            if not block:
+                break
+            block_end = block_start + len(block)
+            search = max(target, block_start) - block_start
+            counted = 0         # quotes includes those of block before this
+            while target is not None and search < len(block):
+                newline = block.find(b"\n", search)
+                if newline < 0:
+                    break
+                quotes += block.count(b'"', counted, newline)
+                counted = newline
+                if quotes % 2 == 0:
+                    start = block_start + newline + 1
+                    starts.append(start)
+                    target = next(pending, None)
+                    while target is not None and target < start:
+                        starts.append(start)    # Chunks smaller than a record
+                        target = next(pending, None)
+                    if target is None:
+                        break
+                    search = max(target, start) - block_start
+                else:
+                    search = newline + 1
+            quotes += block.count(b'"', counted)
+            block_start = block_end
+    size = os.path.getsize(path)
+    return starts + [size] * (len(targets) - len(starts))
+
+
+def header(path: str) -> tuple[list[str], int]:
+    """Column headers of CSV file path, and the byte offset of its first data row"""
+    data_start = record_starts(path, [0])[0]
+    with open(path, "rb") as f:
+        text = f.read(data_start).decode("utf-8-sig")
+    return next(csv.reader(io.StringIO(text)), []), data_start
+
+
+def ranges(path: str, data_start: int, count: int) -> list[tuple[int, int]]:
+    """About count byte ranges (start, end) of the rows of path, each of whole records"""
+    size = os.path.getsize(path)
+    targets = [data_start + (size - data_start) * i // count for i in range(1, count)]
+    points = [data_start, *record_starts(path, targets), size]
+    return [(start, end) for start, end in zip(points, points[1:]) if start < end]
+
+
+def rows(path: str, start: int, end: int, width: int) -> Iterator[list[str | None]]:
+    """Rows of CSV file path in byte range start..end, read as columns.rows reads them"""
+    def lines() -> Iterator[str]:
+        with open(path, "rb") as f:
+            f.seek(start)
+            position = start
+            for line in f:
+                if position >= end:
+                    break
+                position += len(line)
+                yield line.decode("utf-8")
+    return columns.rows(csv.reader(lines()), width)
+
+
+def resolve(labels: tuple, carried: list[str]) -> list[str]:
+    """Labels of a pending row, with unknown labels from the chunks before.
+
+    >>> resolve((None, "b", None), ["x", "y", "z"])
+    ['x', 'b', 'z']
+    """
+    return [before if label is None else label for label, before in zip(labels, carried)]
+
+
+def carry(carried: list[str], last: list[str | None]):
+    """Update carried labels with the last labels of a chunk"""
+    for i, label in enumerate(last):
+        if label is not None:
+            carried[i] = label
+
+
+def map_chunks(path: str, data_start: int, jobs: int, work: Callable, *args) -> Iterator:
+    """Results of work(path, start, end, *args) for the chunks of path,
+    in order, computed in jobs worker processes (or, for one job,
+    in this process).
+    """
+    chunks = ranges(path, data_start, jobs * CHUNKS_PER_JOB)
+    if jobs <= 1:
+        for start, end in chunks:
+            yield work(path, start, end, *args)
+        return
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(work, path, start, end, *args) for start, end in chunks]
+        for future in futures:
+            yield future.result()
@@ -0,0 +1,131 @@
+"""Reading columns of a CSV file by position rather than by name.
+
+csv.DictReader builds a dict for each row, and looking up each field
+by name costs a hash per field per row.  Instead we find the position
+of each column we need once, from the header, and take fields from
+the lists produced by csv.reader with operator.itemgetter.
+
+Rows are read as DictReader would read them: blank lines are skipped,
+and short rows are padded with None (DictReader's restval), so that a
+missing field reads the same as with DictReader.
+
+Numbers in value columns are converted by Converters, which choose
+int() or float() by the text of the field once a column has floats,
+rather than trying int() and then float() (by way of an exception)
+on every field.
+
+Example:
+    reader = csv.reader(f)
+    header = next(reader, [])
+    labels = fields(indexes(header, ["Program", "Level"]))
+    values = fields(indexes(header, ["SCH"]))
+    convert = Converters(guess, 1)
+    for row in rows(reader, len(header)):
+        program, level = labels(row)
+        sch, = convert(values(row))
+"""
+
+import operator
+from typing import Callable, Iterable, Iterator, Sequence
+
+
+def indexes(header: list[str], names: list[str]) -> list[int]:
+    """Position of each of names in header.  As with DictReader,
+    where a name appears more than once, the last column wins.
+
+    >>> indexes(["a", "b", "c", "b"], ["c", "b"])
+    [2, 3]
+    """
+    position = {name: i for i, name in enumerate(header)}
+    missing = [name for name in names if name not in position]
+    if missing:
+        raise KeyError(f"Columns {missing} not in header {header}")
+    return [position[name] for name in names]
+
+
+def fields(positions: list[int]) -> Callable[[list[str]], tuple]:
+    """Function from a row to the tuple of its fields at positions.
+
+    >>> fields([2, 0])(["x", "y", "z"]), fields([1])(["x", "y"]), fields([])(["x"])
+    (('z', 'x'), ('y',), ())
+    """
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda row: (row[position],)
+    if not positions:
+        return lambda row: ()
+    return operator.itemgetter(*positions)
+
+
+def rows(reader: Iterable[list[str]], width: int) -> Iterator[list[str | None]]:
+    """Rows of reader as DictReader would read them, for a header of width columns.
+
+    >>> list(rows([["a", "b"], [], ["c"]], 2))
+    [['a', 'b'], ['c', None]]
+    """
+    for row in reader:
+        if len(row) < width:
+            if not row:
+                continue
+            row = row + [None] * (width - len(row))
+        yield row
+
+
+class Converters:
+    """Converts the value fields of each row exactly as guess would
+    convert each field, where guess tries int(), then float(), then some
+    rule for what is neither, but without trying int() on every float.
+    A column starts with int().  At its first field with ".", "e", "E"
+    or "n" (as in "nan" and "inf"), which int() cannot take, it switches
+    to choosing by the text: float() for such fields, int() for others
+    (whose float would be a whole number, which guess makes an int).
+    A field that the chosen converter does not take is passed to guess.
+    Blank fields ("" or None) are blank_value, or the field itself if
+    blank_value is None, without calling guess.
+
+    >>> def guess(field):
+    ...     for number in (int, float):
+    ...         try:
+    ...             return number(field)
+    ...         except ValueError:
+    ...             pass
+    ...     return f"not {field}"
+    >>> convert = Converters(guess, 2)
+    >>> convert(["1", "2.5"]), convert(["3", "4.0"]), convert(["1e3", "x"]), convert(["6", ""])
+    ([1, 2.5], [3, 4.0], [1000.0, 'not x'], [6, ''])
+    """
+    def __init__(self, guess: Callable[[str | None], object], width: int,
+                 blank_value: object = None):
+        self.guess = guess
+        self.blank_value = blank_value
+        self.converters = [self.as_int(i) for i in range(width)]
+
+    def __call__(self, fields: Sequence[str | None]) -> list:
+        converters = self.converters
+        if len(converters) == 1:   # Most tables have one value column
+            return [converters[0](fields[0])]
+        return [convert(field) for convert, field in zip(converters, fields)]
+
+    def by_text(self, field: str | None) -> object:
+        """Convert field by int() or float() as its text shows"""
+        if not field:
+            return field if self.blank_value is None else self.blank_value
+        try:
+            if "." in field or "e" in field or "E" in field or "n" in field:
+                return float(field)
+            return int(field)
+        except ValueError:
+            return self.guess(field)
+
+    def as_int(self, i: int) -> Callable[[str | None], object]:
+        """Converter for column i, until it has a float"""
+        by_text = self.by_text
+
+        def convert(field: str | None) -> object:
+            try:
+                return int(field)
+            except (ValueError, TypeError):
+                if field and ("." in field or "e" in field or "E" in field or "n" in field):
+                    self.converters[i] = by_text
+                return by_text(field)
+        return convert
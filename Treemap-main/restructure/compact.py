@@ -0,0 +1,150 @@
+"""Compact trees for large restructured data sets, and writing them
+as JSON without building the JSON text in memory.
+
+A tree of nested dicts costs a dict per group and a dict entry per
+leaf, and a new string for each label of each row.  A compact tree
+instead has a slotted Node per group, holding its labels and its
+children (groups or leaf values) in parallel lists.  A group has a
+dict to find its subgroups by label, but leaves are just appended,
+so the many leaves cost two list slots each.
+
+Cursor also shares equal labels of each level of the tree (e.g., the
+same years under each park), and equal int values, through a table
+per level.  The tables are not part of the tree, and each is cleared
+when it reaches SHARED entries, so that a level of unique labels costs
+a bounded table while the tree is built and nothing after.
+
+As in a dict, a label given twice in one group keeps its first place
+and takes its last value; this is resolved when the tree is written.
+
+write_json(node, out) writes exactly what json.dump(tree, out, indent=3)
+writes for the same tree of dicts.
+"""
+
+import io
+import json
+
+INDENT = "   "    # As json.dumps(..., indent=3)
+SHARED = 4096     # Most distinct labels (or values) that Cursor shares at a time, per level
+
+
+class Node:
+    """A group of a compact tree"""
+    __slots__ = ("labels", "children", "groups")
+
+    def __init__(self):
+        self.labels: list[str] = []
+        self.children: list = []      # Nodes and leaf values
+        self.groups: dict[str, "Node"] | None = None   # Created for the first subgroup
+
+    def group(self, label: str) -> "Node":
+        """The subgroup with label, added if it is new"""
+        if self.groups is None:
+            self.groups = {}
+        child = self.groups.get(label)
+        if child is None:
+            child = self.groups[label] = Node()
+            self.labels.append(label)
+            self.children.append(child)
+        return child
+
+    def add(self, label: str, value: object):
+        """Add a leaf (or a whole subtree) with label"""
+        self.labels.append(label)
+        self.children.append(value)
+        if isinstance(value, Node):
+            if self.groups is None:
+                self.groups = {}
+            self.groups[label] = value
+
+    def merge(self, other: "Node"):
+        """Add the entries of other, as if inserted after ours"""
+        for label, child in zip(other.labels, other.children):
+            if isinstance(child, Node) and self.groups and label in self.groups:
+                self.groups[label].merge(child)
+            else:
+                self.add(label, child)
+
+    def entries(self) -> list[tuple[str, object]]:
+        """(label, child) pairs as a dict would hold them"""
+        if len(set(self.labels)) == len(self.labels):
+            return list(zip(self.labels, self.children))
+        return list(dict(zip(self.labels, self.children)).items())
+
+    def to_dict(self) -> dict:
+        return {label: child.to_dict() if isinstance(child, Node) else child
+                for label, child in self.entries()}
+
+
+class Cursor:
+    """As csv_to_json.Cursor, for a compact tree.  Equal labels at the
+    same level, and equal int values, share one object (see above).
+    """
+    def __init__(self, structure: Node):
+        self.structure = structure
+        self.path: list[str] = []
+        # chain[i] is the group of path[:i]; chain[0] is structure
+        self.chain: list[Node] = [structure]
+        self.labels: list[dict[str, str]] = []    # Shared labels of each level
+        self.values: dict[int, int] = {}
+
+    def insert(self, values: object, path: list[str]):
+        depth = len(path) - 1     # Of the leaf
+        labels = self.labels
+        while len(labels) <= depth:
+            labels.append({})
+        shared = 0
+        limit = min(depth, len(self.path) - 1)
+        while shared < limit and path[shared] == self.path[shared]:
+            shared += 1
+        chain = self.chain
+        del chain[shared + 1:]
+        node = chain[shared]
+        for level in range(shared, depth):
+            node = node.group(share(labels[level], path[level]))
+            chain.append(node)
+        if type(values) is int:
+            values = self.values.get(values) or share(self.values, values)
+        elif type(values) is list:
+            values = [share(self.values, value) if type(value) is int else value
+                      for value in values]
+        label = path[depth]
+        node.add(labels[depth].get(label) or share(labels[depth], label), values)
+        self.path = list(path)
+
+
+def share(table: dict, item: object) -> object:
+    """The object equal to item in table, adding item if there is none"""
+    shared = table.get(item)
+    if shared is None:
+        if len(table) >= SHARED:
+            table.clear()
+        shared = table[item] = item
+    return shared
+
+
+def write_json(node: Node, out: io.IOBase, indent: str = ""):
+    """Write node as json.dump(node.to_dict(), out, indent=3) would,
+    a line at a time.
+    """
+    entries = node.entries()
+    if not entries:
+        out.write("{}")
+        return
+    inner = indent + INDENT
+    out.write("{")
+    separator = "\n"
+    for label, child in entries:
+        out.write(f"{separator}{inner}{json.dumps(label)}: ")
+        if isinstance(child, Node):
+            write_json(child, out, inner)
+        else:
+            out.write(json.dumps(child, indent=3).replace("\n", "\n" + inner))
+        separator = ",\n"
+    out.write(f"\n{indent}}}")
+
+
+def dumps(node: Node) -> str:
+    out = io.StringIO()
+    write_json(node, out)
+    return out.getvalue()
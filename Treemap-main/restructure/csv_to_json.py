@@ -35,11 +35,19 @@ import json
 import csv
 import argparse
 import io
+import os
 
 import logging
 import sys
+from typing import Iterable
 
-logging.basicConfig()
+import columns
+import chunked
+import compact as compact_tree
+import checkpoint
+
+# Messages use %-style arguments, so they are formatted only if shown
+# (an f-string of the structure on each insert made unflatten quadratic)
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
@@ -55,6 +63,13 @@ def cli() -> object:
     parser.add_argument("output", type=argparse.FileType(mode="w"),
                         nargs="?", default=sys.stdout,
                         help="Json file representing restructured data")
+    parser.add_argument("--compact", action="store_true",
+                        help="Build a compact tree and write it a line at a time, using less memory")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="Save the tree in FILE, and on later runs read only rows "
+                             "appended to the data file since")
+    parser.add_argument("--jobs", type=int,
+                        help="Parse the data file in chunks in this many processes")
     args = parser.parse_args()
     return args
 
@@ -65,7 +80,7 @@ def load_schema(schema_file: io.IOBase) -> dict[str, list[str]]:
        "values" -> non-empty list of column headers
     """
     schema = json.load(schema_file)
-    log.debug(f"Schema: \n{schema}")
+    log.debug("Schema: \n%s", schema)
     assert isinstance(schema, dict), f"Schema should be a dict with entries 'labels' and 'data'"
     return schema
 
@@ -73,7 +88,7 @@ nest = list[int] | dict[str, 'nest']
 
 def insert(values: list[int], path: list[str], structure: dict):
     """Insert as value as structure[p1][p2][...][key] where pi are elements of path"""
-    log.debug(f"Inserting {values} on path {path} in {structure}")
+    log.debug("Inserting %s on path %s in %s", values, path, structure)
     if len(path) == 1:
         key = path[0]
         structure[key] = values
@@ -85,21 +100,55 @@ def insert(values: list[int], path: list[str], structure: dict):
     insert(values, suffix, structure[initial])
 
 
-def coerce_by_guessing(values: list) -> object:
-    """Best guess at interpretation of value fields.
-    If a field contains only digits, we guess it is an integer.
+class Cursor:
+    """Inserts like insert, remembering the dicts along the path of the
+    last insertion.  Rows of our CSV files are grouped by their labels,
+    so consecutive paths mostly share a prefix; the cursor descends
+    only from the first label that differs from the last path.
+    """
+    def __init__(self, structure: dict):
+        self.structure = structure
+        self.path: list[str] = []
+        # chain[i] is structure[path[0]]...[path[i-1]]; chain[0] is structure
+        self.chain: list[dict] = [structure]
+
+    def insert(self, values: list[int], path: list[str]):
+        """Insert as value as structure[p1][p2][...][key] where pi are elements of path"""
+        log.debug("Inserting %s on path %s", values, path)
+        shared = 0
+        limit = min(len(path), len(self.path)) - 1
+        while shared < limit and path[shared] == self.path[shared]:
+            shared += 1
+        chain = self.chain
+        del chain[shared + 1:]
+        node = chain[shared]
+        for key in path[shared:-1]:
+            if key not in node:
+                node[key] = {}
+            node = node[key]
+            chain.append(node)
+        node[path[-1]] = values
+        self.path = list(path)
+
+
+def guess_value(field: str) -> object:
+    """If a field contains only digits, we guess it is an integer.
     If a looks like a floating point number, we coerce it to float.
     Otherwise we leave it as a string.
+    """
+    try:
+        return int(field)
+    except Exception: pass
+    try:
+        return float(field)
+    except Exception: pass
+    return field
+
+
+def coerce_by_guessing(values: list | tuple) -> object:
+    """Best guess at interpretation of value fields (see guess_value).
     If the list has only a single item, we unpack it.
     """
-    def guess_value(field: str) -> object:
-        try:
-            return int(field)
-        except Exception: pass
-        try:
-            return float(field)
-        except Exception: pass
-        return field
     coerced = [ guess_value(field) for field in values]
     if len(coerced) == 1:
         return coerced[0]
@@ -108,51 +157,183 @@ def coerce_by_guessing(values: list) -> object:
 
 
 
-def unflatten(flat: io.IOBase, schema: dict[str, list[str]]) -> dict:
-    """Reshape in_csv CSV file into tree structure represented as nest of dictionaries.
-    Rows that go in the tree are those with content in the data columns.
-    Each label column is "sticky", i.e., when a column is empty, we assume it is a duplicate
-    of the last non-empty value in that column, whether or not the previous row had
-    data values.
-    """
-    reader = csv.DictReader(flat)
-    values = schema["values"]
+def label_columns(header: list[str], schema: dict[str, list[str]]) -> list[str]:
+    """Label columns of schema that are in header"""
     # Missing column labels could be because we are using a schema for
     # a table that has been summarized by aggregate.py.  Warn but continue.
-    column_labels = reader.fieldnames
     labels = []
     for label in schema["labels"]:
-        if label in column_labels:
+        if label in header:
             labels.append(label)
         else:
-            log.warning(f"Missing column label '{label}' will be ignored")
+            log.warning("Missing column label '%s' will be ignored", label)
+    return labels
 
-    #
-    structure = {}
+
+def unflatten(flat: io.IOBase, schema: dict[str, list[str]],
+              compact: bool = False) -> dict | compact_tree.Node:
+    """Reshape in_csv CSV file into tree structure represented as nest of dictionaries.
+    Rows that go in the tree are those with content in the data columns.
+    Each label column is "sticky", i.e., when a column is empty, we assume it is a duplicate
+    of the last non-empty value in that column, whether or not the previous row had
+    data values.
+    If compact, the tree is a compact_tree.Node rather than dicts.
+    """
+    reader = csv.reader(flat)
+    header = next(reader, [])
+    labels = label_columns(header, schema)
+    structure, cursor = new_tree(compact)
     row_labels = ["NA" for label in labels]
+    insert_rows(columns.rows(reader, len(header)), header, labels, schema["values"],
+                row_labels, cursor)
+    return structure
 
-    for record in reader:
-        for i,label in enumerate(labels):
-            if record[label]:  # Retain "sticky" values when field is empty
-                row_labels[i] = record[label]
-            log.debug(f"Labels effectively {row_labels}")
-        value_fields = [record[field] for field in values]
-        if value_fields[0]:
-            leaf_value = coerce_by_guessing(value_fields)
+
+def insert_rows(rows: Iterable[list[str | None]], header: list[str],
+                labels: list[str], values: list[str],
+                row_labels: list[str], cursor: Cursor | compact_tree.Cursor):
+    """Insert rows with values in the tree of cursor, empty labels
+    repeating the label of the row before, or of row_labels before the
+    first row.  row_labels is updated in place.
+    """
+    # Fields are taken by position, found once from the header
+    label_fields = columns.fields(columns.indexes(header, labels))
+    value_fields = columns.fields(columns.indexes(header, values))
+    # As coerce_by_guessing, but choosing int or float once per column
+    convert = columns.Converters(guess_value, len(values))
+
+    for row in rows:
+        for i, label in enumerate(label_fields(row)):
+            if label:  # Retain "sticky" values when field is empty
+                row_labels[i] = label
+        log.debug("Labels effectively %s", row_labels)
+        fields = value_fields(row)
+        if fields[0]:
+            leaf_value = convert(fields)
+            if len(leaf_value) == 1:
+                leaf_value = leaf_value[0]
             # This row has values to insert
-            log.debug(f"Inserting {row_labels} -> {leaf_value}")
-            insert(leaf_value, row_labels, structure)
+            log.debug("Inserting %s -> %s", row_labels, leaf_value)
+            cursor.insert(leaf_value, row_labels)
+
+
+def new_tree(compact: bool) -> tuple[dict, Cursor] | tuple[compact_tree.Node, compact_tree.Cursor]:
+    """An empty tree, of dicts or compact, and a cursor to insert in it"""
+    if compact:
+        structure = compact_tree.Node()
+        return structure, compact_tree.Cursor(structure)
+    structure = {}
+    return structure, Cursor(structure)
+
+
+def merge(structure: dict, part: dict):
+    """Merge tree part into structure, as if part's rows had been inserted after structure's"""
+    for key, value in part.items():
+        if isinstance(value, dict) and isinstance(structure.get(key), dict):
+            merge(structure[key], value)
+        else:
+            structure[key] = value
+
+
+def unflatten_chunk(path: str, start: int, end: int, header: list[str],
+                    labels: list[str], values: list[str],
+                    compact: bool = False) -> tuple[list, dict | compact_tree.Node, list]:
+    """Unflatten the rows of CSV file path in byte range start..end
+    (see chunked.py).  Returns rows with values whose labels are not
+    all known in the chunk, as (labels, value) with None for unknown
+    labels; the tree of the other rows; and the last labels of the chunk.
+    """
+    label_fields = columns.fields(columns.indexes(header, labels))
+    value_fields = columns.fields(columns.indexes(header, values))
+    convert = columns.Converters(guess_value, len(values))
+
+    pending = []
+    structure, cursor = new_tree(compact)
+    row_labels = [None for label in labels]
+    unknown = len(labels)
+    for row in chunked.rows(path, start, end, len(header)):
+        for i, label in enumerate(label_fields(row)):
+            if label:  # Retain "sticky" values when field is empty
+                if row_labels[i] is None:
+                    unknown -= 1
+                row_labels[i] = label
+        fields = value_fields(row)
+        if fields[0]:
+            leaf_value = convert(fields)
+            if len(leaf_value) == 1:
+                leaf_value = leaf_value[0]
+            if unknown:
+                pending.append((tuple(row_labels), leaf_value))
+            else:
+                cursor.insert(leaf_value, row_labels)
+    return pending, structure, row_labels
+
+
+def unflatten_parallel(path: str, schema: dict[str, list[str]], jobs: int,
+                       compact: bool = False) -> dict | compact_tree.Node:
+    """As unflatten, for CSV file path, parsing chunks of the file in jobs processes"""
+    header, data_start = chunked.header(path)
+    labels = label_columns(header, schema)
+    structure, _ = new_tree(compact)
+    carried = ["NA" for label in labels]
+    for pending, part, last in chunked.map_chunks(path, data_start, jobs, unflatten_chunk,
+                                                  header, labels, schema["values"], compact):
+        # Rows at the start of the chunk come first, with labels from chunks before
+        cursor = compact_tree.Cursor(structure) if compact else Cursor(structure)
+        for row_labels, leaf_value in pending:
+            cursor.insert(leaf_value, chunked.resolve(row_labels, carried))
+        if compact:
+            structure.merge(part)
+        else:
+            merge(structure, part)
+        chunked.carry(carried, last)
     return structure
 
 
+def unflatten_incremental(path: str, schema: dict[str, list[str]], checkpoint_path: str) -> dict:
+    """As unflatten, for CSV file path that only grows by appending rows.
+    The tree and sticky labels are saved in checkpoint_path, so that
+    the next call reads only the rows appended since.
+    """
+    header, data_start = chunked.header(path)
+    labels = label_columns(header, schema)
+    settings = {"labels": labels, "values": schema["values"]}
+    saved = checkpoint.load(checkpoint_path, path, settings)
+    if saved is None:
+        offset, structure, row_labels = data_start, {}, ["NA" for label in labels]
+    else:
+        offset, state = saved
+        structure, row_labels = state["tree"], state["labels"]
+    end = max(offset, checkpoint.complete_end(path))
+    insert_rows(chunked.rows(path, offset, end, len(header)), header, labels, schema["values"],
+                row_labels, Cursor(structure))
+    checkpoint.save(checkpoint_path, path, end, settings, {"labels": row_labels, "tree": structure})
+    return structure
+
 
 def main():
+    logging.basicConfig()
     args = cli()
     map = load_schema(args.schema)
-    log.debug(f"Schema: {map}")
-    structure = unflatten(args.data, map)
+    log.debug("Schema: %s", map)
+    if (args.jobs or args.checkpoint) and not os.path.isfile(args.data.name):
+        raise ValueError("--jobs and --checkpoint need the data to be a file")
+    if args.checkpoint:
+        if args.jobs or args.compact:
+            raise ValueError("--checkpoint cannot be combined with --jobs or --compact")
+        args.data.close()
+        structure = unflatten_incremental(args.data.name, map, args.checkpoint)
+    elif args.jobs:
+        args.data.close()
+        structure = unflatten_parallel(args.data.name, map, args.jobs, args.compact)
+    else:
+        structure = unflatten(args.data, map, args.compact)
     # log.debug(f"Reshaped data: {json.dumps(structure, indent=3)}")
-    print(json.dumps(structure, indent=3), file=args.output)
+    if args.compact:
+        compact_tree.write_json(structure, args.output)
+        print(file=args.output)
+    else:
+        print(json.dumps(structure, indent=3), file=args.output)
 
 
 if __name__ == "__main__":
@@ -14,9 +14,12 @@ import re
 import logging
 import sys
 
-logging.basicConfig()
+import compact as compact_tree
+
+# Messages use %-style arguments, so they are formatted only if shown
+# (an f-string of the structure on each insert made reshape quadratic)
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+log.setLevel(logging.INFO)
 
 def cli() -> object:
     """Command line interface"""
@@ -30,6 +33,8 @@ def cli() -> object:
     parser.add_argument("output", type=argparse.FileType(mode="w"),
                         nargs="?", default=sys.stdout,
                         help="Json file representing restructured data")
+    parser.add_argument("--compact", action="store_true",
+                        help="Build a compact tree and write it a line at a time, using less memory")
     args = parser.parse_args()
     return args
 
@@ -39,15 +44,15 @@ def parse_schema(schema_file: io.IOBase) -> dict[str, list[str]]:
     """
     map = { }
     schema = json.load(schema_file)
-    log.debug(f"Schema: \n{schema}")
+    log.debug("Schema: \n%s", schema)
     assert isinstance(schema, list), f"Schema should be a list of dictionaries"
 
     def build_chains(prefix: list[str], element):
         """Build chains from this element downward through structure"""
-        log.debug(f"Tracing ancestor chain {prefix} through {element}")
+        log.debug("Tracing ancestor chain %s through %s", prefix, element)
         if isinstance(element, str):
             map[element] = prefix.copy()
-            log.debug(f"Added {element}: {prefix} to map")
+            log.debug("Added %s: %s to map", element, prefix)
         elif isinstance(element, list):
             for item in element:
                 build_chains(prefix, item)
@@ -65,7 +70,7 @@ def parse_schema(schema_file: io.IOBase) -> dict[str, list[str]]:
 
 def insert(key: str, value: int, path: list[str], structure: dict):
     """Insert as value as structure[p1][p2][...][key] where pi are elements of path"""
-    log.debug(f"Inserting {key}:{value} on path {path} in {structure}")
+    log.debug("Inserting %s:%s on path %s in %s", key, value, path, structure)
     if len(path) == 0:
         structure[key] = value
         return
@@ -76,24 +81,38 @@ def insert(key: str, value: int, path: list[str], structure: dict):
     insert(key, value, suffix, structure[initial])
 
 
-def reshape(flat: io.IOBase, paths: dict[str, list[str]]) -> dict:
-    """Reshape in_csv CSV file into tree structure represented as nest of dictionaries."""
-    structure = {}
+def reshape(flat: io.IOBase, paths: dict[str, list[str]],
+            compact: bool = False) -> dict | compact_tree.Node:
+    """Reshape in_csv CSV file into tree structure represented as nest of dictionaries
+    (or, if compact, as a compact_tree.Node).
+    """
+    structure = compact_tree.Node() if compact else {}
+    values: dict[int, int] = {}   # Equal values share one int, in a compact tree
     reader = csv.reader(flat)
+    fallback = None   # Built on the first key not in paths
     for record in reader:
-        log.debug(f"Interpreting CSV line as {record}")
+        log.debug("Interpreting CSV line as %s", record)
         key, value = record[:2]
         if key in paths:
             path = paths[key]
         else:
-            path = regex_fallback(key, paths)
-        insert(key, int(value), path, structure)
+            if fallback is None:
+                fallback = PatternIndex(paths)
+            path = fallback.path(key)
+        if compact:
+            # Group labels are those of paths, so already shared
+            node = structure
+            for group in path:
+                node = node.group(group)
+            node.add(key, compact_tree.share(values, int(value)))
+        else:
+            insert(key, int(value), path, structure)
     return structure
 
 def regex_fallback(key: str, paths: dict[str, list[str]]) -> list[str]:
     """If we did not find an exact match, perhaps some of the
-    schema is keyed by regular expressions.
-    FIXME: This linear search of all keys is expensive.
+    schema is keyed by regular expressions.  This linear search
+    of all keys defines the result; PatternIndex finds it faster.
     """
     for pattern, path in paths.items():
         if re.match(pattern, key):
@@ -101,14 +120,108 @@ def regex_fallback(key: str, paths: dict[str, list[str]]) -> list[str]:
     return []
 
 
+# Characters that make a schema key a regular expression rather than a plain name
+SPECIAL = re.compile(r"[.^$*+?{}\[\]\\|()]")
+# Patterns with group references or inline flags, which cannot be combined
+UNCOMBINABLE = re.compile(r"\\[0-9]|\(\?")
+
+
+def literal_prefix(pattern: str) -> str:
+    """Plain text at the start of every match of pattern (perhaps not all of it).
+
+    >>> literal_prefix("CS 1.*"), literal_prefix("ab*c"), literal_prefix("ab+"), literal_prefix("a|b")
+    ('CS 1', 'a', 'ab', '')
+    """
+    if "|" in pattern:
+        return ""
+    special = SPECIAL.search(pattern)
+    if special is None:
+        return pattern
+    prefix = pattern[:special.start()]
+    if special.group() in "*?{":
+        prefix = prefix[:-1]   # The last character may be repeated zero times
+    return prefix
+
+
+class PatternIndex:
+    """Finds the path of a key as regex_fallback would: the path of the
+    first key of paths (in order) that matches the start of key as a
+    regular expression, or [] if none does.  Instead of matching each
+    key of paths in turn:
+      - A plain name (no special characters) matches just the keys it
+        is a prefix of, so we look up each prefix of key in a dict.
+      - Patterns are grouped by the plain text they start with, and
+        only groups for prefixes of key are tried.  The patterns of a
+        group are combined into one alternation, each in a regex group
+        named for its place in paths, so that the first alternative
+        that matches is the first matching pattern.
+      - Results are memoized, as the same keys recur.
+    Patterns that cannot be compiled are ignored, with a warning.
+    """
+    def __init__(self, paths: dict[str, list[str]]):
+        self.paths = list(paths.values())
+        self.names: dict[str, int] = {}   # Place of each plain name in paths
+        # Patterns by literal prefix, in order of place in paths
+        alternatives: dict[str, list[str]] = {}
+        # Patterns that would not work in an alternation are matched one by one
+        self.separate: dict[str, list[tuple[int, re.Pattern]]] = {}
+        for i, pattern in enumerate(paths):
+            if not SPECIAL.search(pattern):
+                self.names.setdefault(pattern, i)
+                continue
+            try:
+                compiled = re.compile(pattern)
+            except re.error as e:
+                log.warning("Ignoring schema key '%s', not a regular expression: %s", pattern, e)
+                continue
+            prefix = literal_prefix(pattern)
+            if UNCOMBINABLE.search(pattern):
+                self.separate.setdefault(prefix, []).append((i, compiled))
+            else:
+                alternatives.setdefault(prefix, []).append(f"(?P<p{i}>{pattern})")
+        self.combined = {prefix: re.compile("|".join(parts)) for prefix, parts in alternatives.items()}
+        self.memo: dict[str, list[str]] = {}
+
+    def first_match(self, key: str) -> int | None:
+        """Place in paths of the first key of paths matching key"""
+        first = None
+        for end in range(len(key) + 1):
+            prefix = key[:end]
+            i = self.names.get(prefix)
+            if i is not None and (first is None or i < first):
+                first = i
+            combined = self.combined.get(prefix)
+            if combined is not None:
+                match = combined.match(key)
+                if match and (first is None or int(match.lastgroup[1:]) < first):
+                    first = int(match.lastgroup[1:])
+            for i, pattern in self.separate.get(prefix, []):
+                if first is not None and i > first:
+                    break
+                if pattern.match(key):
+                    first = i
+                    break
+        return first
+
+    def path(self, key: str) -> list[str]:
+        if key not in self.memo:
+            i = self.first_match(key)
+            self.memo[key] = [] if i is None else self.paths[i]
+        return self.memo[key]
+
 
 def main():
+    logging.basicConfig()
     args = cli()
     map = parse_schema(args.schema)
-    log.debug(f"Ancestry map: {map}")
-    structure = reshape(args.data, map)
+    log.debug("Ancestry map: %s", map)
+    structure = reshape(args.data, map, args.compact)
     # log.debug(f"Reshaped data: {json.dumps(structure, indent=3)}")
-    print(json.dumps(structure, indent=3))
+    if args.compact:
+        compact_tree.write_json(structure, args.output)
+        print(file=args.output)
+    else:
+        print(json.dumps(structure, indent=3), file=args.output)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,411 @@
+"""Treemaps as a local HTTP service, so that a program needing many
+treemaps pays for starting Python and importing modules only once.
+
+Requests are POSTed as JSON objects like
+   {"nest": {"a": 3, "b": [1, 2]}, "width": 500, "height": 300,
+    "options": {"coloring": "path", "viewport": [0, 0, 250, 150]}}
+to /svg (response is an SVG document) or /layout (response is a JSON
+list of tiles and groups, as recorded by graphics/record_display.py).
+With a viewport [llx, lly, urx, ury], only tiles and groups in that
+region are laid out, and the SVG shows just that region.  With
+"max_depth": n, groups nested n deep are collapsed (see mapper.layout);
+adding "expand": [x, y] to the options requests just the layout of the
+collapsed group at point (x, y), within its rectangle.  To drill down
+further, "expand": [[x1, y1], [x2, y2], ...] expands the group at
+each point within the expansion at the point before.
+
+Requests POSTed to /hit also have a list of "points" [[x, y], ...];
+the response is a JSON list with the labels of the groups and tile at
+each point (in layout coordinates, with y increasing upward).  The
+spatial index of the layout (spatial.py) is cached separately, so
+queries on the same treemap do not repeat the layout.
+
+Layout and rendering run in a pool of worker threads (or processes,
+with --processes), behind a cache of recent responses keyed by the
+content of the request.  Identical requests that arrive while the
+first is still being rendered share its result.  The default coloring
+is "path", so that the same request always gets the same picture.
+
+Example use:
+   python3 service.py serve --port 8210
+   python3 service.py bench data/majors-23F.json --requests 500 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import json
+import statistics
+import time
+
+import display
+import geometry
+import mapper
+import spatial
+from graphics.record_display import RecordDisplay
+
+import tracing
+log = tracing.logger(__name__)
+
+ENDPOINTS = ["/svg", "/layout", "/hit"]
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+class BadRequest(Exception):
+    """The request cannot be rendered; reported to the client with status 400"""
+
+
+def render(endpoint: str, request: dict,
+           expand_path: list[spatial.Group] | None = None) -> tuple[str, bytes] | spatial.Node:
+    """Lay out and render a treemap request, or if expand_path is given,
+    just the collapsed group at its end.
+    Returns content type and body of the response, or for
+    endpoint "/index", the spatial index of the layout.
+    """
+    try:
+        nest = request["nest"]
+        width = int(request["width"])
+        height = int(request["height"])
+        options = request.get("options", {})
+        coloring = options.get("coloring", "path")
+        max_depth = options.get("max_depth")
+        if max_depth is not None:
+            max_depth = int(max_depth)
+        viewport = None
+        if options.get("viewport"):
+            llx, lly, urx, ury = [int(v) for v in options["viewport"]]
+            viewport = geometry.Rect(geometry.Point(llx, lly), geometry.Point(urx, ury))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise BadRequest(f"Request needs nest, width, and height: {e}")
+    if width <= 0 or height <= 0:
+        raise BadRequest(f"Width and height must be positive, not {width} x {height}")
+    if coloring not in display.COLORINGS:
+        raise BadRequest(f"Coloring must be one of {display.COLORINGS}")
+    if endpoint == "/svg":
+        renderer = display.svg_only(width, height, coloring=coloring, viewport=viewport)
+    elif endpoint == "/layout":
+        renderer = display.Display([RecordDisplay(width, height)], coloring)
+    else:
+        renderer = display.Display([], coloring)
+    try:
+        if expand_path:
+            index = mapper.expand(expand_path, renderer, max_depth)
+            renderer.close(index)
+        else:
+            index = mapper.treemap(nest, width, height, renderer, viewport, max_depth)
+    except (AssertionError, ValueError, TypeError, ZeroDivisionError) as e:
+        raise BadRequest(f"Cannot lay out nest: {e}")
+    if endpoint == "/index":
+        return index
+    medium = renderer.media[0]
+    if endpoint == "/svg":
+        return "image/svg+xml", medium.text().encode("utf-8")
+    return "application/json", json.dumps(medium.records).encode("utf-8")
+
+
+class TreemapService:
+    """HTTP server for treemap requests, with a cache of the
+    cache_size most recently used responses.
+    """
+    def __init__(self, workers: int = 4, cache_size: int = 256, processes: bool = False):
+        if processes:
+            self.pool = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        self.cache_size = cache_size
+        # Futures of responses, least recently used first.  Only the
+        # event loop thread touches the cache, so it needs no lock.
+        self.cache: collections.OrderedDict[str, asyncio.Future] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.Server:
+        """Start listening; port 0 picks a free port"""
+        server = await asyncio.start_server(self.handle, host, port)
+        log.info(f"Serving treemaps on {server.sockets[0].getsockname()}")
+        return server
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def respond(self, endpoint: str, request: dict) -> tuple[str, bytes]:
+        """Content type and content of the response to request"""
+        if endpoint == "/hit":
+            return await self.hit(request)
+        if isinstance(request, dict) and "expand" in (request.get("options") or {}):
+            return await self.expansion(endpoint, request)
+        return await self.cached(endpoint, request)
+
+    async def expansion(self, endpoint: str, request: dict) -> tuple[str, bytes]:
+        """Layout of the collapsed group at the point given as the expand
+        option, or with a list of points, of the collapsed group at the
+        last point within the expansions of the groups at the points before.
+        """
+        options = dict(request["options"])
+        points = expand_points(options.pop("expand"))
+        # Each expansion is laid out (and cached) from the index of the one before
+        index = await self.cached("/index", dict(request, options=options))
+        path = []
+        for i, (x, y) in enumerate(points):
+            if i > 0:
+                index = await self.cached("/index", dict(request, options=dict(options, expand=points[:i])),
+                                          path)
+            hits = spatial.hit_test(index, x, y)
+            if not hits or not spatial.is_collapsed(hits[-1]):
+                raise BadRequest(f"No collapsed group at ({x}, {y})")
+            path = path + hits
+        return await self.cached(endpoint, request, path)
+
+    async def hit(self, request: dict) -> tuple[str, bytes]:
+        """Labels at each of the points of a /hit request"""
+        try:
+            points = [(float(x), float(y)) for x, y in request["points"]]
+            treemap_request = {"nest": request["nest"], "width": request["width"],
+                               "height": request["height"],
+                               "options": request.get("options", {})}
+        except (KeyError, TypeError, ValueError) as e:
+            raise BadRequest(f"Request needs nest, width, height, and points: {e}")
+        index = await self.cached("/index", treemap_request)
+        hits = [spatial.labels_at(index, x, y) for x, y in points]
+        return "application/json", json.dumps(hits).encode("utf-8")
+
+    async def cached(self, endpoint: str, request: dict,
+                     *args) -> tuple[str, bytes] | spatial.Node:
+        """Result of rendering request (with args), from the cache if possible"""
+        key = cache_key(endpoint, request)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            # Shielded, so that a client that goes away does not cancel
+            # the render for others waiting on it
+            return await asyncio.shield(self.cache[key])
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, render, endpoint, request, *args)
+        self.cache[key] = future
+        future.add_done_callback(lambda done: self.forget_failure(key, done))
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return await asyncio.shield(future)
+
+    def forget_failure(self, key: str, future: asyncio.Future):
+        """Don't keep failures, whether or not anyone still waits for them"""
+        if future.cancelled() or future.exception() is not None:
+            if self.cache.get(key) is future:
+                del self.cache[key]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break   # Client closed connection
+                method, path, headers = parse_head(head)
+                length = int(headers.get("content-length", "0"))
+                if length > MAX_BODY_BYTES:
+                    await send(writer, 413, "text/plain", b"Request too large")
+                    break
+                body = await reader.readexactly(length)
+                status, content_type, content = await self.dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await send(writer, status, content_type, content, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            log.warning(f"Dropping connection: {e}")
+        finally:
+            writer.close()
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> tuple[int, str, bytes]:
+        """Status, content type, and content of the response to a request"""
+        if path not in ENDPOINTS:
+            return 404, "text/plain", f"Endpoints are {ENDPOINTS}".encode("utf-8")
+        if method != "POST":
+            return 405, "text/plain", b"Use POST"
+        try:
+            request = json.loads(body)
+            content_type, content = await self.respond(path, request)
+            return 200, content_type, content
+        except (json.JSONDecodeError, BadRequest) as e:
+            return 400, "text/plain", str(e).encode("utf-8")
+        except Exception as e:
+            log.exception(f"Failed to render request for {path}")
+            return 500, "text/plain", f"Internal error: {e}".encode("utf-8")
+
+
+def cache_key(endpoint: str, request: object) -> str:
+    """Key of the response to request, the same whatever the order of
+    keys in the request and its options, but not of the nest, whose
+    order is that of the treemap.
+    """
+    if isinstance(request, dict):
+        rest = {name: value for name, value in request.items() if name != "nest"}
+        text = json.dumps([json.dumps(request.get("nest"), separators=(",", ":")), rest],
+                          separators=(",", ":"), sort_keys=True)
+    else:
+        text = json.dumps(request, separators=(",", ":"))
+    return hashlib.sha256((endpoint + text).encode("utf-8")).hexdigest()
+
+
+def expand_points(expand: object) -> list[list[float]]:
+    """Points of the expand option, a point [x, y] or a list of them
+
+    >>> expand_points([1, 2]), expand_points([[1, 2], [3, 4.5]])
+    ([[1.0, 2.0]], [[1.0, 2.0], [3.0, 4.5]])
+    """
+    try:
+        if expand and isinstance(expand[0], list):
+            return [[float(x), float(y)] for x, y in expand]
+        x, y = expand
+        return [[float(x), float(y)]]
+    except (TypeError, ValueError, KeyError) as e:
+        raise BadRequest(f"Expand needs a point [x, y] or a list of points: {e}")
+
+
+def parse_head(head: bytes) -> tuple[str, str, dict[str, str]]:
+    """Method, path, and headers (with lower case names) of an HTTP request"""
+    lines = head.decode("latin-1").split("\r\n")
+    method, path, version = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, path, headers
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+async def send(writer: asyncio.StreamWriter, status: int, content_type: str,
+               content: bytes, keep_alive: bool = False):
+    connection = "keep-alive" if keep_alive else "close"
+    writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                 f"Content-Type: {content_type}\r\n"
+                 f"Content-Length: {len(content)}\r\n"
+                 f"Connection: {connection}\r\n\r\n".encode("latin-1"))
+    writer.write(content)
+    await writer.drain()
+
+
+# ------
+# A client, for testing and for measuring concurrency and latency
+
+async def post(host: str, port: int, path: str, request: dict) -> tuple[int, bytes]:
+    """POST request as JSON on a new connection; returns status and body of response"""
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(request).encode("utf-8")
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, _, header_text = head.decode("latin-1").partition("\r\n")
+    status = int(status_line.split()[1])
+    length = 0
+    for line in header_text.split("\r\n"):
+        if line.lower().startswith("content-length:"):
+            length = int(line.split(":", 1)[1])
+    content = await reader.readexactly(length)
+    writer.close()
+    return status, content
+
+
+async def load_test(host: str, port: int, path: str, requests: list[dict],
+                    concurrency: int) -> dict:
+    """POST each of requests, with up to concurrency requests outstanding.
+    Returns throughput and latency statistics.
+    """
+    latencies = []
+    statuses = collections.Counter()
+    pending = iter(requests)
+
+    async def client():
+        for request in pending:
+            begin = time.perf_counter()
+            status, _ = await post(host, port, path, request)
+            latencies.append(time.perf_counter() - begin)
+            statuses[status] += 1
+
+    begin = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - begin
+    latencies.sort()
+    def percentile(p: float) -> float:
+        return 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    return {"requests": len(latencies), "concurrency": concurrency,
+            "statuses": dict(statuses),
+            "seconds": elapsed,
+            "requests_per_second": len(latencies) / elapsed,
+            "latency_ms": {"mean": 1000 * statistics.mean(latencies),
+                           "p50": percentile(0.50), "p90": percentile(0.90),
+                           "p99": percentile(0.99), "max": 1000 * latencies[-1]}}
+
+
+async def bench(args: argparse.Namespace):
+    """Start a service and load-test it with variations of one nest.
+    Requests vary in width, so about (1 - 1/distinct) of them miss the cache.
+    """
+    service = TreemapService(args.workers, processes=args.processes)
+    server = await service.start()
+    host, port = server.sockets[0].getsockname()[:2]
+    nest = json.load(args.input)
+    requests = [{"nest": nest, "width": args.width + i % args.distinct, "height": args.height}
+                for i in range(args.requests)]
+    stats = await load_test(host, port, args.endpoint, requests, args.concurrency)
+    stats["cache"] = {"hits": service.hits, "misses": service.misses}
+    print(json.dumps(stats, indent=3))
+    server.close()
+    await server.wait_closed()
+    service.close()
+
+
+async def serve(args: argparse.Namespace):
+    service = TreemapService(args.workers, args.cache_size, args.processes)
+    server = await service.start(args.host, args.port)
+    async with server:
+        await server.serve_forever()
+
+
+def cli() -> object:
+    """Obtain command and options from the command line."""
+    parser = argparse.ArgumentParser("Treemaps as a local HTTP service")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of worker threads (or processes) for rendering")
+    parser.add_argument("--processes", action="store_true",
+                        help="Render in worker processes rather than threads")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Run the service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8210)
+    serve_parser.add_argument("--cache-size", type=int, default=256,
+                              help="Number of recent responses to keep")
+    bench_parser = commands.add_parser("bench", help="Measure throughput and latency")
+    bench_parser.add_argument("input", type=argparse.FileType("r"),
+                              help="Nest to render, in json format")
+    bench_parser.add_argument("--endpoint", choices=ENDPOINTS, default="/svg")
+    bench_parser.add_argument("--width", type=int, default=800)
+    bench_parser.add_argument("--height", type=int, default=600)
+    bench_parser.add_argument("--requests", type=int, default=200)
+    bench_parser.add_argument("--concurrency", type=int, default=10)
+    bench_parser.add_argument("--distinct", type=int, default=20,
+                              help="Number of distinct requests (the rest hit the cache)")
+    return parser.parse_args()
+
+
+def main():
+    tracing.configure()
+    args = cli()
+    if args.command == "serve":
+        asyncio.run(serve(args))
+    else:
+        asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Spatial index of a laid-out treemap, for finding the tile
+(and enclosing groups) under a point, e.g., for tool-tips.
+
+The layout is itself a binary space partition: each bisection of a
+list divides its rectangle in two.  mapper.layout returns the tree of
+those splits, with tiles at the leaves and groups along the way, so
+a point query just follows the splits down from the root, taking time
+proportional to the depth of the layout (logarithmic in the number
+of tiles for a balanced nest) rather than to the number of tiles.
+
+Nodes keep plain coordinates rather than geometry.Rect objects, because
+there is one node for each tile, and tiles can number in the millions.
+"""
+
+
+class Tile:
+    """A single labeled rectangle"""
+    __slots__ = ("llx", "lly", "urx", "ury", "label")
+
+    def __init__(self, llx: int, lly: int, urx: int, ury: int, label: str):
+        self.llx, self.lly, self.urx, self.ury = llx, lly, urx, ury
+        self.label = label
+
+    def __repr__(self) -> str:
+        return f"Tile({self.llx}, {self.lly}, {self.urx}, {self.ury}, {self.label!r})"
+
+
+class Group:
+    """A labeled rectangle containing the layout of a nested nest.
+    A collapsed group (see mapper.layout) has no layout of its
+    contents yet; instead it keeps the nest to be laid out.
+    """
+    __slots__ = ("llx", "lly", "urx", "ury", "label", "child", "nest")
+
+    def __init__(self, llx: int, lly: int, urx: int, ury: int, label: str, child: "Node",
+                 nest: object = None):
+        self.llx, self.lly, self.urx, self.ury = llx, lly, urx, ury
+        self.label = label
+        self.child = child
+        self.nest = nest
+
+    def __repr__(self) -> str:
+        return f"Group({self.llx}, {self.lly}, {self.urx}, {self.ury}, {self.label!r})"
+
+
+class Split:
+    """A rectangle divided in two.  The first part has the same lower
+    left corner as the whole, and upper right corner (first_urx, first_ury),
+    so a point of the whole is in the first part if it is below and left
+    of that corner.
+    """
+    __slots__ = ("first_urx", "first_ury", "first", "second")
+
+    def __init__(self, first_urx: int, first_ury: int, first: "Node", second: "Node"):
+        self.first_urx, self.first_ury = first_urx, first_ury
+        self.first = first
+        self.second = second
+
+
+# None for an empty nest, or one outside the viewport of a layout
+Node = Tile | Group | Split | None
+
+
+def contains(node: Tile | Group, x: float, y: float) -> bool:
+    return node.llx <= x < node.urx and node.lly <= y < node.ury
+
+
+def is_collapsed(node: Node) -> bool:
+    return isinstance(node, Group) and node.nest is not None
+
+
+def hit_test(node: Node, x: float, y: float) -> list[Tile | Group]:
+    """The groups (outermost first) and tile containing point (x, y),
+    or [] if the point is not on a tile.  The last element is a group,
+    rather than a tile, if the point is in a collapsed group.
+
+    >>> index = Split(50, 100, Tile(0, 0, 50, 100, "a"),
+    ...               Group(50, 0, 100, 100, "b", Tile(50, 0, 100, 100, "c")))
+    >>> hit_test(index, 75, 10)
+    [Group(50, 0, 100, 100, 'b'), Tile(50, 0, 100, 100, 'c')]
+    >>> hit_test(index, 120, 10)
+    []
+    """
+    path = []
+    while node is not None:
+        if isinstance(node, Split):
+            if x < node.first_urx and y < node.first_ury:
+                node = node.first
+            else:
+                node = node.second
+        elif not contains(node, x, y):
+            return []
+        elif isinstance(node, Group):
+            path.append(node)
+            if node.nest is not None:   # Collapsed
+                return path
+            node = node.child
+        else:
+            path.append(node)
+            return path
+    return []
+
+
+def labels_at(node: Node, x: float, y: float) -> list[str]:
+    """Labels of the groups and tile containing point (x, y)"""
+    return [hit.label for hit in hit_test(node, x, y)]
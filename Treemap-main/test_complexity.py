@@ -0,0 +1,68 @@
+"""Tests that hot paths scale linearly (or n log n), by fitting the
+exponent of running time over growing inputs (see bench/scaling.py)
+rather than comparing times with a fixed limit, which depends on the
+speed of the machine.
+"""
+
+import unittest
+import io
+import os
+import random
+import sys
+
+import mapper
+import pyramid
+from bench import generators
+from bench.scaling import best_time, fitted_exponent, scaling_exponent
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "restructure"))
+import csv_to_json
+import schematize
+
+# Near 1 for linear and n log n over these sizes; 2 for quadratic.
+# Halfway between, so that noise in timing does not fail a linear
+# algorithm, nor pass a quadratic one.
+MAX_EXPONENT = 1.5
+
+
+def doubling(start: int, count: int = 5) -> list[int]:
+    return [start * 2 ** i for i in range(count)]
+
+
+class TestScaling(unittest.TestCase):
+    def assertNearLinear(self, make_input, work, sizes):
+        exponent = scaling_exponent(make_input, work, sizes)
+        self.assertLess(exponent, MAX_EXPONENT, f"Time grows as n**{exponent:.2f}")
+
+    def test_fast_work_is_timed(self):
+        # Work faster than the clock's tick is repeated until it can be timed
+        self.assertGreater(best_time(lambda: None), 0)
+        with self.assertRaises(ValueError):
+            fitted_exponent([1, 2], [0.0, 0.001])
+
+    def test_bisect(self):
+        self.assertNearLinear(lambda n: generators.flat(n, random.Random(1)),
+                              mapper.bisect, doubling(2 ** 11, 6))
+
+    def test_deep_sum(self):
+        self.assertNearLinear(lambda n: generators.labelled(n, random.Random(1)),
+                              mapper.deep_sum, doubling(2 ** 11, 6))
+
+    def test_layout(self):
+        self.assertNearLinear(lambda n: generators.mixed(n, random.Random(1)),
+                              lambda nest: mapper.treemap(nest, 1600, 1200, pyramid.NoDisplay()),
+                              doubling(2 ** 7, 6))
+
+    def test_unflatten(self):
+        self.assertNearLinear(lambda n: generators.columns_csv(n, random.Random(1)),
+                              lambda data: csv_to_json.unflatten(io.StringIO(data[0]), data[1]),
+                              doubling(2 ** 8, 6))
+
+    def test_reshape(self):
+        self.assertNearLinear(lambda n: generators.keyed_csv(n, random.Random(1)),
+                              lambda data: schematize.reshape(io.StringIO(data[0]), data[1]),
+                              doubling(2 ** 8, 6))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Unit tests for display.py, using SVG rendering only (no Tk window)"""
+
+import unittest
+import concurrent.futures
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+
+import display
+import geometry
+import mapper
+import spatial
+import graphics.svg_display as svg
+from graphics.record_display import RecordDisplay
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+
+
+def render(nest: mapper.Nest, width: int = 300, height: int = 200) -> str:
+    """SVG text of a treemap of nest"""
+    renderer = display.svg_only(width, height)
+    mapper.treemap(nest, width, height, renderer)
+    return renderer.media[0].text()
+
+
+class TestDisplay(unittest.TestCase):
+    def test_svg_only(self):
+        svg = render({"a": 3, "b": {"c": 1, "d": 2}})
+        root = ET.fromstring(svg)
+        self.assertEqual(root.get("width"), "300")
+        tiles = root.findall(f".//{SVG_NS}rect[@class='tile']")
+        self.assertEqual(len(tiles), 3)
+
+    def test_renderers_independent(self):
+        """Renderings in concurrent threads must not share state"""
+        nests = [[i] * (i + 1) for i in range(20)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(render, nests))
+        for nest, svg in zip(nests, results):
+            root = ET.fromstring(svg)
+            tiles = root.findall(f".//{SVG_NS}rect[@class='tile']")
+            self.assertEqual(len(tiles), len(nest))
+
+    def test_path_coloring_repeatable(self):
+        nest = {"Fruit": {"Apples": 3, "Pears": 2}, "Nuts": 4}
+        first = display.svg_only(300, 200, coloring="path")
+        mapper.treemap(nest, 300, 200, first)
+        second = display.svg_only(300, 200, coloring="path")
+        mapper.treemap(nest, 300, 200, second)
+        self.assertEqual(first.media[0].text(), second.media[0].text())
+
+    def test_labels_fit_or_become_titles(self):
+        svg = render({"Computer Science": 1, "Data Science": 9}, 400, 100)
+        root = ET.fromstring(svg)
+        texts = ["".join(t.itertext()) for t in root.iter(f"{SVG_NS}text")]
+        titles = [t.text for t in root.iter(f"{SVG_NS}title")]
+        self.assertEqual(texts, ["Data Science9"])
+        self.assertEqual(titles, ["Computer Science – 1"])
+
+    def test_viewport_culls_tiles(self):
+        nest = [1] * 16
+        whole = display.Display([RecordDisplay(400, 400)])
+        mapper.treemap(nest, 400, 400, whole)
+        corner = geometry.Rect(geometry.Point(0, 0), geometry.Point(100, 100))
+        zoomed = display.Display([RecordDisplay(400, 400)])
+        mapper.treemap(nest, 400, 400, zoomed, corner)
+        self.assertEqual(len(whole.media[0].records), 16)
+        self.assertEqual(len(zoomed.media[0].records), 1)
+
+    def test_index_finds_tiles(self):
+        nest = {"Fruit": {"Apples": 3, "Pears": 2}, "Nuts": 4}
+        recorder = RecordDisplay(400, 300)
+        index = mapper.treemap(nest, 400, 300, display.Display([recorder]))
+        for record in recorder.records:
+            x = record["x"] + record["width"] / 2
+            y = record["y"] + record["height"] / 2
+            hits = spatial.hit_test(index, x, y)
+            self.assertEqual(hits[record["depth"]].label, record["label"])
+
+    def test_collapsed_groups_expand(self):
+        nest = {"Fruit": {"Apples": 3, "Pears": 2}, "Nuts": 4}
+        recorder = RecordDisplay(400, 300)
+        index = mapper.treemap(nest, 400, 300, display.Display([recorder]), max_depth=0)
+        self.assertEqual(sorted(r["label"] for r in recorder.records if r["kind"] == "tile"),
+                         ["Fruit", "Nuts\n4"])
+        fruit = [r for r in recorder.records if r["label"] == "Fruit" and r["kind"] == "tile"][0]
+        path = spatial.hit_test(index, fruit["x"] + 1, fruit["y"] + 1)
+        self.assertTrue(spatial.is_collapsed(path[-1]))
+        expanded = RecordDisplay(400, 300)
+        child = mapper.expand(path, display.Display([expanded]))
+        self.assertEqual(sorted(r["label"] for r in expanded.records if r["kind"] == "tile"),
+                         ["Apples\n3", "Pears\n2"])
+        self.assertEqual(len(spatial.hit_test(child, fruit["x"] + 1, fruit["y"] + 1)), 1)
+
+    def test_streamed_svg_same_as_buffered(self):
+        nest = {"Fruit": {"Apples": 3, "Pears": 2}, "Nuts": 4, "Seeds": [1] * 20}
+        buffered = display.svg_only(400, 300, coloring="path")
+        mapper.treemap(nest, 400, 300, buffered)
+        chunk, svg.STREAM_CHUNK = svg.STREAM_CHUNK, 5
+        try:
+            with tempfile.TemporaryDirectory() as out_dir:
+                path = os.path.join(out_dir, "streamed.svg")
+                streamed = display.svg_only(400, 300, path, coloring="path", stream=True)
+                mapper.treemap(nest, 400, 300, streamed)
+                self.assertLess(len(streamed.media[0].buffer), 5)
+                with open(path) as f:
+                    self.assertEqual(f.read(), buffered.media[0].text())
+        finally:
+            svg.STREAM_CHUNK = chunk
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Tests of timing phases of a treemap, and of counting work done"""
+
+import unittest
+import json
+import tracemalloc
+
+import display
+import mapper
+import profiling
+import metrics
+
+NEST = {"Fruit": {"Apples": 3, "Pears": 2}, "Nuts": 4}
+
+
+class TestProfiling(unittest.TestCase):
+    def test_phases_accumulate(self):
+        timer = profiling.PhaseTimer()
+        for _ in range(3):
+            with timer.phase("parse"):
+                json.loads('{"a": 1}')
+        calls, wall, cpu, _ = timer.totals["parse"]
+        self.assertEqual(calls, 3)
+        self.assertGreaterEqual(wall, 0.0)
+
+    def test_recursive_calls_timed_once(self):
+        timer = profiling.PhaseTimer()
+
+        def count_down(n: int) -> int:
+            return 0 if n == 0 else timed(n - 1)
+        timed = timer.timed("count", count_down)
+        timed(10)
+        self.assertEqual(timer.totals["count"][0], 1)
+
+    def test_treemap_phases(self):
+        timer = profiling.PhaseTimer(profile=["layout"])
+        mapper.treemap(NEST, 400, 300, display.svg_only(400, 300), timer=timer)
+        report = json.loads(json.dumps(timer.report()))
+        self.assertEqual([phase["phase"] for phase in report["phases"]], ["layout", "close"])
+        functions = [row["function"] for row in report["profiles"]["layout"]]
+        self.assertTrue(any("(layout)" in function for function in functions))
+
+    def test_peak_memory(self):
+        timer = profiling.PhaseTimer(memory=True)
+        with timer.phase("outer"):
+            with timer.phase("inner"):
+                big = [0] * 1_000_000
+                del big
+            small = [0] * 1000
+        tracemalloc.stop()
+        report = {phase["phase"]: phase["peak_bytes"] for phase in timer.report()["phases"]}
+        self.assertGreater(report["inner"], 7_000_000)   # A million 8-byte pointers
+        self.assertGreaterEqual(report["outer"], report["inner"])
+
+
+class TestMetrics(unittest.TestCase):
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_disabled_counts_nothing(self):
+        metrics.reset()
+        mapper.treemap(NEST, 400, 300, display.svg_only(400, 300))
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_counts(self):
+        metrics.reset()
+        metrics.enable()
+        mapper.treemap(NEST, 400, 300, display.svg_only(400, 300, coloring="path"))
+        counts = metrics.snapshot()
+        self.assertEqual(counts["layout.tiles"], 3)
+        self.assertEqual(counts["layout.groups"], 1)
+        self.assertEqual(counts["rect.split"], counts["bisect.calls"])
+        self.assertEqual(counts["color.chosen"], 2)   # Fruit and Nuts; Fruit's tiles share its color
+        self.assertGreater(counts["svg.elements"], 8)
+
+    def test_counts_after_import(self):
+        metrics.reset()
+        metrics.enable()
+        renderer = display.svg_only(400, 300)
+        mapper.treemap(NEST, 400, 300, renderer)
+        svg = renderer.media[0].text()
+        renderer.media[0].text()    # Counted once, however often taken
+        counts = metrics.snapshot()
+        self.assertEqual(counts["svg.bytes"], len(svg.encode("utf-8")))
+        self.assertGreater(counts["palette.rejected"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""Tests of the map tile pyramid"""
+
+import unittest
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+
+import display
+import pyramid
+import mapper
+from graphics.record_display import RecordDisplay
+
+NEST = {"Fruit": {"Apples": 3, "Pears": 2}, "Nuts": 4, "Seeds": [1] * 40}
+
+
+class TestPyramid(unittest.TestCase):
+    def test_writes_every_tile(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            count = pyramid.pyramid(NEST, out_dir, 2, tile_size=64, workers=2)
+            self.assertEqual(count, 1 + 4 + 16)
+            for z in range(3):
+                for x in range(2 ** z):
+                    for y in range(2 ** z):
+                        root = ET.parse(os.path.join(out_dir, str(z), str(x), f"{y}.svg")).getroot()
+                        self.assertEqual(root.get("width"), "64")
+
+    def test_replay_matches_layout(self):
+        # At full size, drawing the whole index is the same as the layout
+        recorder = RecordDisplay(400, 400)
+        index = mapper.treemap(NEST, 400, 400, display.Display([recorder], "path"))
+        replayed = RecordDisplay(400, 400)
+        view = pyramid.TileView(0, 0, 0, 400, 400)
+        pyramid.replay(index, 0, 0, 400, 400, view, display.Display([replayed], "path"))
+        self.assertEqual(replayed.records, recorder.records)
+
+    def test_replay_culls(self):
+        index = mapper.treemap([1] * 16, 400, 400, pyramid.NoDisplay())
+        corner = RecordDisplay(100, 100)
+        view = pyramid.TileView(2, 0, 0, 400, 400)
+        pyramid.replay(index, 0, 0, 400, 400, view, display.Display([corner]))
+        self.assertEqual(len(corner.records), 1)
+
+    def test_tiles_are_quiet(self):
+        # One line per tile would be millions of lines for a deep pyramid
+        index = mapper.treemap(NEST, 256, 256, pyramid.NoDisplay())
+        pyramid.init_worker(index, 256)
+        with tempfile.TemporaryDirectory() as out_dir:
+            with self.assertNoLogs(level="INFO"):
+                pyramid.render_tile(out_dir, 64, 2, 1, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
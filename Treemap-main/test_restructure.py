@@ -0,0 +1,370 @@
+"""Tests of restructuring tables (CSV) into nests (restructure/)"""
+
+import unittest
+import unittest.mock
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from typing import Iterator
+
+from bench import generators
+import treemap
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "restructure"))
+import csv_to_json
+import aggregate
+import chunked
+import checkpoint
+import schematize
+import compact
+
+DATA = os.path.join(HERE, "restructure", "data")
+
+
+def data_file(name: str) -> str:
+    with open(os.path.join(DATA, name), encoding="utf-8-sig") as f:
+        return f.read()
+
+
+def unflatten_by_insert(flat: str, schema: dict) -> dict:
+    """The tree built row by row with csv_to_json.insert, from the root"""
+    structure = {}
+    labels = schema["labels"]
+    row_labels = ["NA" for _ in labels]
+    for record in csv_to_json.csv.DictReader(io.StringIO(flat)):
+        for i, label in enumerate(labels):
+            if record[label]:
+                row_labels[i] = record[label]
+        fields = [record[field] for field in schema["values"]]
+        if fields[0]:
+            csv_to_json.insert(csv_to_json.coerce_by_guessing(fields), list(row_labels), structure)
+    return structure
+
+
+class TestUnflatten(unittest.TestCase):
+    def test_example(self):
+        flat = "Program,Level,Course,SCH\nCS,1xx,CS 102,376\nCS,1xx,CS 110,976\nCS,3xx,CS 330,320\n"
+        schema = {"labels": ["Program", "Level", "Course"], "values": ["SCH"]}
+        self.assertEqual(csv_to_json.unflatten(io.StringIO(flat), schema),
+                         {"CS": {"1xx": {"CS 102": 376, "CS 110": 976}, "3xx": {"CS 330": 320}}})
+
+    def test_sticky_labels(self):
+        flat = data_file("SCH-indent.csv")
+        schema = {"labels": ["Program", "Level", "Course"], "values": ["SCH"]}
+        tree = csv_to_json.unflatten(io.StringIO(flat), schema)
+        self.assertEqual(tree["CS"]["1xx"]["CS 102"], 376)
+        self.assertEqual(tree, unflatten_by_insert(flat, schema))
+
+    def test_same_as_insert(self):
+        for seed in range(5):
+            flat, schema = generators.columns_csv(500, random.Random(seed))
+            tree = csv_to_json.unflatten(io.StringIO(flat), schema)
+            self.assertEqual(json.dumps(tree), json.dumps(unflatten_by_insert(flat, schema)))
+
+    def test_short_and_blank_rows(self):
+        flat = "A,B,V,W\nx,y,1,2\n\nx,,3\nz\n,w,4,5,extra\n"
+        schema = {"labels": ["A", "B"], "values": ["V", "W"]}
+        self.assertEqual(csv_to_json.unflatten(io.StringIO(flat), schema),
+                         {"x": {"y": [3, None]}, "z": {"w": [4, 5]}})
+
+    def test_types_as_guessed(self):
+        rng = random.Random(1)
+        cells = ["1", "2.5", "3.0", "-4", "1e3", " 7 ", "inf", "", "x", "+3"]
+        flat = "A,V,W\n" + "".join(f"a{i},{rng.choice(cells)},{rng.choice(cells)}\n" for i in range(500))
+        for values in [["V", "W"], ["V"]]:
+            schema = {"labels": ["A"], "values": values}
+            self.assertEqual(repr(csv_to_json.unflatten(io.StringIO(flat), schema)),
+                             repr(unflatten_by_insert(flat, schema)))
+
+    def test_cursor_returns_to_earlier_path(self):
+        structure = {}
+        cursor = csv_to_json.Cursor(structure)
+        cursor.insert(1, ["a", "b", "c"])
+        cursor.insert(2, ["a", "d", "e"])
+        cursor.insert(3, ["a", "b", "f"])
+        cursor.insert(4, ["g", "b", "c"])
+        self.assertEqual(structure, {"a": {"b": {"c": 1, "f": 3}, "d": {"e": 2}}, "g": {"b": {"c": 4}}})
+
+
+class TestTreemapFromCSV(unittest.TestCase):
+    def test_same_values_as_json(self):
+        flat, schema = generators.columns_csv(200, random.Random(1))
+        via_json = json.loads(json.dumps(csv_to_json.unflatten(io.StringIO(flat), schema), indent=3))
+        self.assertEqual(treemap.read_values(io.StringIO(flat), io.StringIO(json.dumps(schema))), via_json)
+        self.assertEqual(treemap.read_values(io.StringIO(json.dumps(via_json))), via_json)
+
+
+class TestCompact(unittest.TestCase):
+    def test_same_json(self):
+        flat, schema = generators.columns_csv(500, random.Random(1))
+        flat += "P0,L0,C1,7\nP0,L0,C1,\nP9,L9,C9,2.5\n"   # Repeated and float leaves
+        tree = csv_to_json.unflatten(io.StringIO(flat), schema)
+        node = csv_to_json.unflatten(io.StringIO(flat), schema, compact=True)
+        self.assertEqual(compact.dumps(node), json.dumps(tree, indent=3))
+        self.assertEqual(node.to_dict(), tree)
+        keyed, paths = generators.keyed_csv(500, random.Random(1))
+        self.assertEqual(compact.dumps(schematize.reshape(io.StringIO(keyed), paths, compact=True)),
+                         json.dumps(schematize.reshape(io.StringIO(keyed), paths), indent=3))
+
+    def test_parallel(self):
+        path = os.path.join(DATA, "US-National-Parks_RecreationVisits_1979-2023.csv")
+        schema = {"labels": ["Region", "State", "ParkName", "Year"], "values": ["RecreationVisits"]}
+        self.assertEqual(compact.dumps(csv_to_json.unflatten_parallel(path, schema, 5, compact=True)),
+                         json.dumps(csv_to_json.unflatten_parallel(path, schema, 5), indent=3))
+
+    PARKS = "Park,Year,Visits\n" + "".join(f"Park {park},{year},{park * year}\n"
+                                            for park in range(300) for year in range(1979, 2024))
+    PARKS_SCHEMA = {"labels": ["Park", "Year"], "values": ["Visits"]}
+
+    def test_smaller_tree(self):
+        """Memory kept by the tree itself, once built"""
+        def retained(work) -> int:
+            tracemalloc.start()
+            tree = work()
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            return size
+        flat, schema = generators.columns_csv(20_000, random.Random(1))
+        keyed, paths = generators.keyed_csv(20_000, random.Random(1))
+        for unflatten, limit in [(lambda compact: csv_to_json.unflatten(io.StringIO(self.PARKS),
+                                                                        self.PARKS_SCHEMA, compact), 0.5),
+                                 (lambda compact: csv_to_json.unflatten(io.StringIO(flat), schema, compact), 0.85),
+                                 (lambda compact: schematize.reshape(io.StringIO(keyed), paths, compact), 0.85)]:
+            as_dicts = retained(lambda: unflatten(False))
+            as_nodes = retained(lambda: unflatten(True))
+            self.assertLess(as_nodes, limit * as_dicts)
+
+    def test_less_memory(self):
+        flat, schema = self.PARKS, self.PARKS_SCHEMA
+
+        def peak(work) -> int:
+            tracemalloc.start()
+            work()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+        as_dicts = peak(lambda: json.dumps(csv_to_json.unflatten(io.StringIO(flat), schema), indent=3))
+        with open(os.devnull, "w") as out:
+            as_nodes = peak(lambda: compact.write_json(
+                csv_to_json.unflatten(io.StringIO(flat), schema, compact=True), out))
+        self.assertLess(as_nodes, 0.75 * as_dicts)
+
+
+class TestAggregate(unittest.TestCase):
+    def test_summarize(self):
+        schema = {"labels": ["Month", "Week", "Meal"], "values": ["Coffee", "Tea"]}
+        out = io.StringIO()
+        aggregate.summarize(io.StringIO(data_file("beverages_by_meal.csv")),
+                            aggregate.control_field_labels(schema["labels"], "Week"),
+                            schema["values"], out)
+        self.assertEqual(out.getvalue().splitlines(),
+                         ["Month,Week,Coffee,Tea", "Jan,1,10,10", "Jan,2,10,10", "Feb,2,10,10"])
+
+    def test_sums_of_ints_and_floats(self):
+        out = io.StringIO()
+        aggregate.summarize(io.StringIO("A,V\na,1\na,2.5\na,\na,3\nb,2\n"), ["A"], ["V"], out)
+        self.assertEqual(out.getvalue().splitlines(), ["A,V", "a,6.5", "b,2"])
+
+    def test_unsorted(self):
+        flat = "A,B,V\nx,p,1\ny,q,2\nx,,3\nx,r,4\ny,q,5\n"
+        for max_groups in [100, 1]:
+            out = io.StringIO()
+            aggregate.summarize(io.StringIO(flat), ["A", "B"], ["V"], out,
+                                unsorted=True, max_groups=max_groups)
+            self.assertEqual(out.getvalue().splitlines(), ["A,B,V", "x,p,1", "x,q,3", "x,r,4", "y,q,7"])
+
+    def test_rollup_as_each_level(self):
+        flat, schema = generators.columns_csv(500, random.Random(1))
+        for unsorted in [False, True]:
+            outs = [io.StringIO() for _ in schema["labels"]]
+            aggregate.summarize_rollup(io.StringIO(flat), schema["labels"], schema["values"], outs,
+                                       unsorted=unsorted)
+            for k, out in enumerate(outs, start=1):
+                expected = io.StringIO()
+                aggregate.summarize(io.StringIO(flat), schema["labels"][:k], schema["values"], expected,
+                                    unsorted=unsorted)
+                self.assertEqual(out.getvalue(), expected.getvalue())
+
+    def test_rollup_tagged(self):
+        out = io.StringIO()
+        aggregate.summarize_rollup(io.StringIO("A,B,V\nx,p,1\nx,q,2\ny,q,3\n"), ["A", "B"], ["V"], [out],
+                                   tagged=True)
+        self.assertEqual(out.getvalue().splitlines(),
+                         ["by,A,B,V", "B,x,p,1", "B,x,q,2", "A,x,,3", "B,y,q,3", "A,y,,3"])
+
+    def test_rollup_one_level(self):
+        """A {level} file name gives files as summarize writes them, even for one level"""
+        flat = "A,B,V\nx,p,1\nx,q,2\ny,q,3\n"
+        with tempfile.TemporaryDirectory() as folder:
+            schema, data = os.path.join(folder, "schema.json"), os.path.join(folder, "data.csv")
+            with open(schema, "w") as f:
+                json.dump({"labels": ["A", "B"], "values": ["V"]}, f)
+            with open(data, "w") as f:
+                f.write(flat)
+            output = os.path.join(folder, "r-{level}.csv")
+            with unittest.mock.patch.object(sys, "argv", ["aggregate.py", schema, data, "--by", "A",
+                                                          "--rollup", output]):
+                aggregate.main()
+            with open(output.format(level="A")) as f:
+                self.assertEqual(f.read().splitlines(), ["A,V", "x,3", "y,3"])
+
+    def test_missing_column(self):
+        with self.assertRaises(KeyError):
+            aggregate.summarize(io.StringIO("A,V\nx,1\n"), ["A"], ["W"], io.StringIO())
+
+
+class TestSchematize(unittest.TestCase):
+    def test_pattern_index_as_linear_search(self):
+        keys = ["CS", "CS 1.*", "CIT 2.*", "M.*H", "(A)(B)?C", "(a)\\1", "(?i)cs", "x|y",
+                "CS 10", "[0-9]+", "CS 1+0", "CS 10?2", "CS 1{2}", "C**"]
+        rng = random.Random(1)
+        for _ in range(100):
+            paths = {key: [f"G{i}"] for i, key in enumerate(rng.sample(keys, rng.randint(0, len(keys))))}
+            index = schematize.PatternIndex(paths)
+            valid = {pattern: path for pattern, path in paths.items() if pattern != "C**"}
+            for key in ["CS 102", "cs 1", "CIT 210", "MOTH", "ABC", "aa", "y", "123", "zzz", "", "CS 11"]:
+                self.assertEqual(index.path(key), schematize.regex_fallback(key, valid))
+
+    def test_reshape(self):
+        with open(os.path.join(DATA, "sch-schema.json")) as f:
+            paths = schematize.parse_schema(f)
+        tree = schematize.reshape(io.StringIO(data_file("sch.csv")), paths)
+        self.assertEqual(tree["CS 1xx"]["CS 102"], 376)
+
+
+class TestChunked(unittest.TestCase):
+    """Parsing in chunks, with more chunks than rows of some groups"""
+    def setUp(self):
+        flat, self.schema = generators.columns_csv(1000, random.Random(1))
+        # A quoted label with a newline, which must not end a chunk
+        flat = flat.replace("C1,", '"C1, ""quoted""\nlabel",', 1)
+        self.flat = self.with_file(flat)
+
+    def with_file(self, text: str) -> str:
+        f = tempfile.NamedTemporaryFile("w", suffix=".csv", encoding="utf-8-sig", delete=False)
+        with f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_record_starts(self):
+        path = self.with_file('a,b\n"x\ny",1\nz,2\n')
+        self.assertEqual(chunked.header(path), (["a", "b"], 7))
+        self.assertEqual(chunked.record_starts(path, [7, 9, 15, 100]), [15, 15, 19, 19])
+
+    def test_many_newlines_in_quotes(self):
+        # Quotes are counted once per block, not again at each newline
+        text = 'a,b\n"' + "x\n" * 200_000 + '",1\nz,2\n'
+        path = self.with_file(text)
+        start = len(text.encode("utf-8-sig")) - len("z,2\n")
+        self.assertEqual(chunked.record_starts(path, [10, start]), [start, len(text.encode("utf-8-sig"))])
+
+    def test_summarize_not_a_file(self):
+        out = io.StringIO()
+        with self.assertLogs(aggregate.log, "WARNING"):
+            aggregate.summarize(io.StringIO("A,V\nx,1\nx,2\n"), ["A"], ["V"], out, jobs=4)
+        self.assertEqual(out.getvalue().splitlines(), ["A,V", "x,3"])
+
+    def test_unflatten(self):
+        with open(self.flat, encoding="utf-8-sig") as f:
+            expected = json.dumps(csv_to_json.unflatten(f, self.schema))
+        for jobs in [1, 2, 40]:
+            self.assertEqual(json.dumps(csv_to_json.unflatten_parallel(self.flat, self.schema, jobs)), expected)
+
+    def test_sticky_across_chunks(self):
+        path = os.path.join(DATA, "SCH-indent.csv")
+        with open(path, encoding="utf-8-sig") as f:
+            expected = csv_to_json.unflatten(f, self.schema)
+        self.assertEqual(csv_to_json.unflatten_parallel(path, self.schema, 10), expected)
+
+    def test_summarize(self):
+        for unsorted in [False, True]:
+            expected, out = io.StringIO(), io.StringIO()
+            with open(self.flat, encoding="utf-8-sig") as f:
+                aggregate.summarize(f, self.schema["labels"][:2], self.schema["values"], expected,
+                                    unsorted=unsorted)
+            with open(self.flat, encoding="utf-8-sig") as f:
+                aggregate.summarize(f, self.schema["labels"][:2], self.schema["values"], out,
+                                    unsorted=unsorted, jobs=10)
+            self.assertEqual(out.getvalue(), expected.getvalue())
+
+    def test_unsorted_chunks_spill(self):
+        labels, values = self.schema["labels"][:2], self.schema["values"]
+        header, data_start = chunked.header(self.flat)
+        pending, groups, runs, last = aggregate.summarize_chunk(
+            self.flat, data_start, os.path.getsize(self.flat), header, labels, values, True, 5)
+        # Past max_groups, a chunk returns its groups in run files, not in a list
+        self.assertEqual(groups, [])
+        self.assertGreater(len(runs), 1)
+        aggregate.remove_runs(runs)
+        expected = io.StringIO()
+        with open(self.flat, encoding="utf-8-sig") as f:
+            aggregate.summarize(f, labels, values, expected, unsorted=True)
+        with tempfile.TemporaryDirectory() as spilled:
+            with unittest.mock.patch.object(tempfile, "tempdir", spilled):
+                for max_groups in [3, 100]:
+                    out = io.StringIO()
+                    with open(self.flat, encoding="utf-8-sig") as f:
+                        aggregate.summarize(f, labels, values, out, unsorted=True,
+                                            max_groups=max_groups, jobs=3)
+                    self.assertEqual(out.getvalue(), expected.getvalue())
+            self.assertEqual(os.listdir(spilled), [])
+
+
+class TestCheckpoint(unittest.TestCase):
+    """Reading a growing file in several runs, as if it were read once"""
+    def setUp(self):
+        self.flat, self.schema = generators.columns_csv(300, random.Random(2))
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "flat.csv")
+        self.saved = os.path.join(self.dir.name, "checkpoint.json")
+
+    def grow(self, *stops: float) -> Iterator[None]:
+        """Write the data up to each of stops (fractions of its length,
+        ending within a row), then all of it
+        """
+        data = self.flat.encode()
+        for stop in [*stops, 1]:
+            with open(self.path, "wb") as f:
+                f.write(data[:int(len(data) * stop)])
+            yield
+
+    def test_summarize(self):
+        labels, values = self.schema["labels"][:2], self.schema["values"]
+        out = os.path.join(self.dir.name, "out.csv")
+        for unsorted in [False, True]:
+            expected = io.StringIO()
+            aggregate.summarize(io.StringIO(self.flat), labels, values, expected, unsorted=unsorted)
+            for _ in self.grow(0.3, 0.3, 0.71):
+                aggregate.summarize_incremental(self.path, labels, values, out, self.saved,
+                                                unsorted=unsorted)
+            with open(out, newline="") as f:
+                self.assertEqual(f.read(), expected.getvalue())
+
+    def test_unflatten(self):
+        expected = csv_to_json.unflatten(io.StringIO(self.flat), self.schema)
+        for _ in self.grow(0.5, 0.9):
+            tree = csv_to_json.unflatten_incremental(self.path, self.schema, self.saved)
+        self.assertEqual(json.dumps(tree), json.dumps(expected))
+
+    def test_changed_file_is_read_again(self):
+        with open(self.path, "w") as f:
+            f.write("A,V\nx,1\ny,2\n")
+        self.assertEqual(csv_to_json.unflatten_incremental(self.path, {"labels": ["A"], "values": ["V"]},
+                                                           self.saved), {"x": 1, "y": 2})
+        with open(self.path, "w") as f:
+            f.write("A,V\nx,5\ny,2\nz,3\n")
+        with self.assertLogs(checkpoint.log, "WARNING"):
+            tree = csv_to_json.unflatten_incremental(self.path, {"labels": ["A"], "values": ["V"]},
+                                                     self.saved)
+        self.assertEqual(tree, {"x": 5, "y": 2, "z": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
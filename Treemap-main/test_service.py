@@ -0,0 +1,145 @@
+"""Tests of the treemap HTTP service, with a local client"""
+
+import unittest
+import asyncio
+import json
+import xml.etree.ElementTree as ET
+
+import service
+
+NEST = {"Fruit": {"Apples": 3, "Pears": 2}, "Nuts": 4}
+
+
+class TestService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = service.TreemapService(workers=4)
+        self.server = await self.service.start()
+        self.host, self.port = self.server.sockets[0].getsockname()[:2]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.service.close()
+
+    async def test_svg(self):
+        status, body = await service.post(self.host, self.port, "/svg",
+                                          {"nest": NEST, "width": 400, "height": 300})
+        self.assertEqual(status, 200)
+        root = ET.fromstring(body)
+        self.assertEqual(root.get("height"), "300")
+
+    async def test_layout(self):
+        status, body = await service.post(self.host, self.port, "/layout",
+                                          {"nest": NEST, "width": 400, "height": 300})
+        self.assertEqual(status, 200)
+        records = json.loads(body)
+        tiles = [r for r in records if r["kind"] == "tile"]
+        self.assertEqual(sum(t["width"] * t["height"] for t in tiles), 400 * 300)
+        self.assertEqual(sorted(t["label"] for t in tiles),
+                         ["Apples\n3", "Nuts\n4", "Pears\n2"])
+
+    async def test_hit(self):
+        request = {"nest": NEST, "width": 400, "height": 300,
+                   "points": [[1, 1], [399, 299], [500, 10]]}
+        status, body = await service.post(self.host, self.port, "/hit", request)
+        self.assertEqual(status, 200)
+        hits = json.loads(body)
+        self.assertEqual(len(hits), 3)
+        self.assertIn(hits[0][-1], ["Apples\n3", "Pears\n2", "Nuts\n4"])
+        self.assertEqual(hits[2], [])
+        # The layout is reused for more points
+        request["points"] = [[200, 150]]
+        await service.post(self.host, self.port, "/hit", request)
+        self.assertEqual(self.service.misses, 1)
+
+    async def test_expand(self):
+        request = {"nest": NEST, "width": 400, "height": 300, "options": {"max_depth": 0}}
+        status, body = await service.post(self.host, self.port, "/layout", request)
+        self.assertEqual(status, 200)
+        fruit = [r for r in json.loads(body) if r["label"] == "Fruit" and r["kind"] == "tile"][0]
+        request["options"]["expand"] = [fruit["x"] + 1, fruit["y"] + 1]
+        status, body = await service.post(self.host, self.port, "/layout", request)
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(r["label"] for r in json.loads(body) if r["kind"] == "tile"),
+                         ["Apples\n3", "Pears\n2"])
+        request["options"]["expand"] = [fruit["x"] + fruit["width"] + 1, fruit["y"] + 1]
+        status, _ = await service.post(self.host, self.port, "/layout", request)
+        self.assertEqual(status, 400)
+
+    async def test_expand_nested(self):
+        nest = {"A": {"B": {"x": 1, "y": 2}, "c": 3}, "d": 4}
+        request = {"nest": nest, "width": 400, "height": 300, "options": {"max_depth": 0}}
+
+        async def tiles(*points) -> list[dict]:
+            if points:
+                request["options"]["expand"] = list(points)
+            status, body = await service.post(self.host, self.port, "/layout", request)
+            self.assertEqual(status, 200)
+            return [r for r in json.loads(body) if r["kind"] == "tile"]
+
+        a = [t for t in await tiles() if t["label"] == "A"][0]
+        a_point = [a["x"] + 1, a["y"] + 1]
+        b = [t for t in await tiles(a_point) if t["label"] == "B"][0]
+        b_point = [b["x"] + 1, b["y"] + 1]
+        self.assertEqual(sorted(t["label"] for t in await tiles(a_point, b_point)), ["x\n1", "y\n2"])
+        # Colors by label path, as in the whole treemap
+        request["options"] = {}
+        whole = {t["label"]: t["fill_color"] for t in await tiles()}
+        request["options"] = {"max_depth": 0}
+        self.assertEqual({t["label"]: t["fill_color"] for t in await tiles(a_point, b_point)},
+                         {label: whole[label] for label in ["x\n1", "y\n2"]})
+
+    async def test_bad_requests(self):
+        status, _ = await service.post(self.host, self.port, "/svg", {"nest": NEST})
+        self.assertEqual(status, 400)
+        status, _ = await service.post(self.host, self.port, "/png", {"nest": NEST})
+        self.assertEqual(status, 404)
+
+    async def test_cached_whatever_the_order_of_keys(self):
+        first = {"nest": {"a": 1, "b": {"c": 2, "d": 3}}, "width": 400, "height": 300,
+                 "options": {"coloring": "path", "max_depth": 1}}
+        second = {"options": {"max_depth": 1, "coloring": "path"}, "height": 300, "width": 400,
+                  "nest": {"a": 1, "b": {"c": 2, "d": 3}}}
+        # The order of the nest is the order of the treemap, so this is another picture
+        reordered_nest = dict(second, nest={"b": {"d": 3, "c": 2}, "a": 1})
+        responses = []
+        for request in [first, second, reordered_nest]:
+            status, body = await service.post(self.host, self.port, "/layout", request)
+            self.assertEqual(status, 200)
+            responses.append(body)
+        self.assertEqual((self.service.misses, self.service.hits), (2, 1))
+        self.assertEqual(responses[0], responses[1])
+        self.assertNotEqual(responses[0], responses[2])
+
+    async def test_bad_sizes_and_nests(self):
+        for request in [{"nest": NEST, "width": -10, "height": 300},
+                        {"nest": NEST, "width": 400, "height": 0},
+                        {"nest": {"a": 0, "b": 0}, "width": 400, "height": 300}]:
+            status, _ = await service.post(self.host, self.port, "/svg", request)
+            self.assertEqual(status, 400, request)
+        self.assertEqual(len(self.service.cache), 0)
+
+    async def test_cancelled_waiter(self):
+        # Large enough to be still rendering when the first waiter goes away
+        nest = {f"k{i}": i + 1 for i in range(2000)}
+        request = {"nest": nest, "width": 400, "height": 300}
+        first = asyncio.create_task(self.service.respond("/svg", request))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(self.service.respond("/svg", request))
+        await asyncio.sleep(0)
+        first.cancel()
+        content_type, _ = await second
+        self.assertEqual(content_type, "image/svg+xml")
+        self.assertEqual(self.service.misses, 1)
+
+    async def test_concurrent_requests_cached(self):
+        requests = [{"nest": NEST, "width": 400 + i % 5, "height": 300} for i in range(50)]
+        stats = await service.load_test(self.host, self.port, "/svg", requests, concurrency=10)
+        self.assertEqual(stats["statuses"], {200: 50})
+        self.assertEqual(self.service.misses, 5)
+        self.assertEqual(self.service.hits, 45)
+        self.assertGreater(stats["requests_per_second"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,8 @@
 """Unit tests for splitter.py"""
 
 import unittest
-import time  # To distinguish linear-time from quadratic time solutions
 from mapper import bisect
+from bench.scaling import scaling_exponent  # To distinguish linear-time from quadratic time solutions
 
 import logging
 logging.basicConfig()
@@ -74,25 +74,20 @@ class Tests(unittest.TestCase):
         self.assertEqual(parts,  ([6, 5], [4, 3, 2, 1]))
 
     def test_fast_enough(self):
-        """Note: 50_000 entries is chosen empirically to be enough to
-        take about 20 to 30 seconds on a 2020 M1 macbook pro
-        using the quadratic algorithm, but around .01 seconds with the
-        linear time algorithm.
-        It will be annoying to students with slow computers, but
-        I want to be sure this test can distinguish between linear time and quadratic
-        time even on a fast "gaming" desktop computer for at least a few years.
+        """A quadratic algorithm was once 20 to 30 seconds on 50_000
+        entries, where a linear algorithm takes around .01 seconds.
+        Rather than a time limit, which depends on the computer, we
+        check how the time grows with the number of entries (see
+        bench/scaling.py): about n**1 for linear, n**2 for quadratic.
         """
-        a_lot = 50_000
-        li = [1] * a_lot   # A lot of 1s
-        li.append(a_lot)   # Make it split off just the last element
-        begin_time = time.time()
-        parts = bisect(li)
-        end_time = time.time()
-        elapsed = end_time - begin_time
-        log.debug(f"Splitting {a_lot+1} items in {elapsed} seconds")
-        # A linear time solution should finish in less than a second
-        self.assertLess(elapsed, 1.0)
-
+        def lots_of_ones(a_lot: int) -> list[int]:
+            li = [1] * a_lot   # A lot of 1s
+            li.append(a_lot)   # Make it split off just the last element
+            return li
+        sizes = [3_125, 6_250, 12_500, 25_000, 50_000, 100_000]
+        exponent = scaling_exponent(lots_of_ones, bisect, sizes)
+        log.debug(f"Time to split grows as n**{exponent:.2f}")
+        self.assertLess(exponent, 1.5)
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,58 @@
+"""Debugging and progress messages for the treemap modules.
+
+Each module gets its logger from tracing.logger(__name__).  Levels
+come from environment variable TREEMAP_LOG, a default level optionally
+followed by levels for particular modules, e.g.,
+    TREEMAP_LOG=DEBUG                  all modules at DEBUG
+    TREEMAP_LOG=INFO,geometry=DEBUG    just geometry at DEBUG
+so that seeing debugging messages does not require editing the code.
+The default is INFO.
+
+Messages in code that runs often (per tile, per split, per row) use
+logging's %-style arguments rather than f-strings:
+    log.debug("Splitting %s into %s, %s", self, bottom, top)
+The message is then formatted only if it will be shown, whereas an
+f-string is formatted on every call, shown or not.
+
+Where messages go is up to the main program: tracing.configure()
+in main, rather than logging.basicConfig() in each module at import.
+"""
+
+import logging
+import os
+
+DEFAULT_LEVEL = "INFO"
+
+
+def levels(spec: str) -> tuple[str, dict[str, str]]:
+    """Default level and levels by module from a TREEMAP_LOG value.
+
+    >>> levels("INFO,geometry=DEBUG")
+    ('INFO', {'geometry': 'DEBUG'})
+    """
+    default, by_module = DEFAULT_LEVEL, {}
+    for part in spec.split(","):
+        part = part.strip().upper()
+        if not part:
+            continue
+        if "=" in part:
+            module, level = part.split("=", 1)
+            by_module[module.lower()] = level
+        else:
+            default = part
+    return default, by_module
+
+
+DEFAULT, BY_MODULE = levels(os.environ.get("TREEMAP_LOG", ""))
+
+
+def logger(name: str) -> logging.Logger:
+    """Logger for module name, at the level chosen by TREEMAP_LOG"""
+    log = logging.getLogger(name)
+    log.setLevel(BY_MODULE.get(name.lower(), DEFAULT))
+    return log
+
+
+def configure():
+    """Show messages on standard error; for main programs"""
+    logging.basicConfig()
@@ -5,28 +5,120 @@
 
 import json    # Acquire data to be mapped in JSON exchange format  (see https://www.json.org)
 import argparse
+import io
+import os
+import sys
 import mapper
+import display
+import geometry
+import profiling
+import metrics
+import memory_budget
+import tracing
+log = tracing.logger(__name__)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "restructure"))
+import csv_to_json
 
 def cli() -> object:
     """Obtain input file and options from the command line.
     Returns an object with a field for each option.
     """
     parser = argparse.ArgumentParser("Depict a data set as a squarified treemap")
-    parser.add_argument("input", help="Data input in json format",
-                        type=argparse.FileType("r"))
+    parser.add_argument("input", help="Data input in json format (or CSV, with --schema)",
+                        type=argparse.FileType("r", encoding="utf-8-sig"))
     parser.add_argument("width", help="width of canvas in pixels",
                         type=int)
     parser.add_argument("height", help="height of canvas in pixels",
                         type=int)
+    parser.add_argument("--schema", type=argparse.FileType("r"),
+                        help="input is CSV, to be read into a tree with this schema "
+                             "(see restructure/csv_to_json.py), without writing JSON in between")
+    parser.add_argument("--coloring", choices=display.COLORINGS, default="random",
+                        help="random colors, or colors determined by labels (same on every run)")
+    parser.add_argument("--viewport", type=int, nargs=4, metavar=("LLX", "LLY", "URX", "URY"),
+                        help="show only this region of the treemap, enlarged to fill the canvas")
+    parser.add_argument("--max-depth", type=int,
+                        help="collapse groups nested this deep (0 collapses top level groups); "
+                             "click a collapsed group to expand it")
+    parser.add_argument("--profile", action="store_true",
+                        help="print wall and CPU time of each phase on standard error")
+    parser.add_argument("--profile-json", type=argparse.FileType("w"),
+                        help="write times of phases to this file as JSON")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="also profile the layout with cProfile")
+    parser.add_argument("--memory", action="store_true",
+                        help="with --profile or --profile-json, also report peak memory of each phase")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="if drawing would need more memory than this, collapse deep groups "
+                             "or stream the SVG file without the Tk display")
+    parser.add_argument("--metrics", action="store_true",
+                        help="print counts of work done (splits, tiles, colors, SVG bytes ...) "
+                             "on standard error as JSON")
     args = parser.parse_args()
     return args
 
 
+def read_values(data: io.IOBase, schema_file: io.IOBase | None = None) -> mapper.Nest:
+    """Values to be mapped from JSON input, or from CSV input with a
+    schema, as csv_to_json.py would read them but without the JSON.
+    """
+    if schema_file is None:
+        return json.load(data)
+    return csv_to_json.unflatten(data, csv_to_json.load_schema(schema_file))
+
+
+def time_media(renderer: display.Display, timer: profiling.PhaseTimer):
+    """Time drawing on each medium, color choices, and finishing each
+    medium (writing SVG; for Tk, waiting for the user to close it).
+    """
+    renderer.new_color = timer.timed("color", renderer.new_color)
+    for medium in renderer.media:
+        name = type(medium).__name__
+        for method in ["draw_rect", "begin_group", "end_group"]:
+            setattr(medium, method, timer.timed(f"draw {name}", getattr(medium, method)))
+        medium.close = timer.timed(f"close {name}", medium.close)
+
+
 def main():
     """Display and produce an SVG treemap of the input data."""
+    tracing.configure()
     args = cli()
-    values = json.load(args.input)
-    mapper.treemap(values, args.width, args.height)
+    profiled = args.profile or args.profile_json or args.cprofile
+    if profiled:
+        timer = profiling.PhaseTimer(profile=["layout"] if args.cprofile else [],
+                                     memory=args.memory)
+    else:
+        timer = profiling.NULL_TIMER
+    if args.metrics:
+        metrics.enable()
+    with timer.phase("parse"):
+        values = read_values(args.input, args.schema)
+    viewport = None
+    if args.viewport:
+        llx, lly, urx, ury = args.viewport
+        viewport = geometry.Rect(geometry.Point(llx, lly), geometry.Point(urx, ury))
+    max_depth, stream = args.max_depth, False
+    if args.memory_budget:
+        plan = memory_budget.plan(values, int(args.memory_budget * 2 ** 20), max_depth)
+        max_depth, stream = plan.max_depth, plan.stream
+    if stream:
+        renderer = display.svg_only(args.width, args.height, "treemap.svg", args.coloring,
+                                    viewport, stream=True)
+    else:
+        renderer = display.tk_and_svg(args.width, args.height, coloring=args.coloring,
+                                      viewport=viewport)
+    # Once per run; each SVGDisplay (e.g., per tile of a pyramid) logs only at DEBUG
+    log.info("SVG figure will be written to treemap.svg")
+    if profiled:
+        time_media(renderer, timer)
+    mapper.treemap(values, args.width, args.height, renderer, viewport, max_depth, timer)
+    if args.profile or args.cprofile:
+        print(timer.summary(), file=sys.stderr)
+    if args.profile_json:
+        json.dump(timer.report(), args.profile_json, indent=3)
+    if args.metrics:
+        print(json.dumps(metrics.snapshot(), indent=3), file=sys.stderr)
 
 
 if __name__ == "__main__":